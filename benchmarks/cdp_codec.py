@@ -0,0 +1,187 @@
+'''
+    CDP codec replay benchmark.
+
+    Replays CDP frames through every installed codec backend, once with a
+    full decode per frame (the old `msg.json()` path) and once with the
+    lazy `method` peek used by `ChromeDebugg`. Frames are synthetic or
+    the incoming frames of a `CDPRecorder` recording.
+
+    Checked before timing, per backend: every frame decodes to what
+    `json.loads` gives, commands survive an encode and decode, `peek_method`
+    returns the frame's method or `UNKNOWN` (always `UNKNOWN` for error
+    replies, which must reach a full decode) and target events decode to
+    the same ids.
+
+    Usage: python -m benchmarks.cdp_codec [--frames 100000] [--recording file]
+'''
+
+
+from argparse import ArgumentParser
+from json import dumps, loads
+from time import perf_counter, process_time
+from typing import List
+
+from helpers.codec import TARGET_EVENTS, UNKNOWN, CDPCodec
+from helpers.events import EventPipeline
+from helpers.recorder import read_recording
+
+
+def synthetic_frames(count: int) -> List[str]:
+    '''
+        Mixed traffic: mostly `Network.*` events, command replies and
+        a few target events, serialised like Chrome does
+
+        :param count: int - number of frames
+
+        Return `List[str]`
+    '''
+
+    frames = []
+
+    for i in range(count):
+        if i % 50 == 0:
+            frames.append(dumps({
+                'method': 'Target.attachedToTarget',
+                'params': {
+                    'sessionId': f'S{i}',
+                    'targetInfo': {
+                        'targetId': f'T{i}', 'type': 'page',
+                        'url': 'about:blank', 'attached': True
+                    },
+                    'waitingForDebugger': True
+                }
+            }, separators=(',', ':')))
+        elif i % 100 == 10:
+            frames.append(dumps({
+                'id': i, 'error': {'code': -32601, 'message': 'method not found'}
+            }, separators=(',', ':')))
+        elif i % 10 == 0:
+            frames.append(dumps({'id': i, 'result': {}}, separators=(',', ':')))
+        else:
+            frames.append(dumps({
+                'method': 'Network.responseReceived',
+                'params': {
+                    'requestId': f'{i}.1', 'loaderId': 'L1', 'type': 'Script',
+                    'timestamp': 1000.0 + i,
+                    'response': {
+                        'url': f'https://example.com/asset/{i}.js',
+                        'status': 200, 'headers': {'content-type': 'text/javascript'},
+                        'mimeType': 'text/javascript', 'encodedDataLength': 4096
+                    }
+                }
+            }, separators=(',', ':')))
+
+    return frames
+
+
+def recorded_frames(path: str) -> List[str]:
+    '''
+        Frames Chrome sent in a recording, in order
+
+        :param path: str - `.ndjson.gz` file written by `CDPRecorder`
+
+        Return `List[str]`
+    '''
+
+    return [
+        frame for _, _, direction, frame in read_recording(path)
+        if direction == 'in'
+    ]
+
+
+def check(codec: CDPCodec, frames: List[str]) -> None:
+    '''
+        Assert `codec` agrees with `json` on every frame
+    '''
+
+    for frame in frames:
+        expected = loads(frame)
+        method = expected.get('method', None)
+
+        assert codec.loads(frame) == expected, f'{codec.backend}: decoded {frame}'
+        assert loads(codec.dumps(expected)) == expected, f'{codec.backend}: encoded {frame}'
+
+        peeked = codec.peek_method(frame)
+        assert peeked is UNKNOWN or peeked == method, f'{codec.backend}: peeked {peeked!r}'
+        assert 'error' not in expected or peeked is UNKNOWN, \
+            f'{codec.backend}: error reply skipped: {frame}'
+
+        if method in TARGET_EVENTS:
+            event = codec.decode_target_event(frame)
+
+            assert event.method == method and \
+                event.params.targetInfo.targetId == expected['params']['targetInfo']['targetId'] \
+                and event.params.sessionId == expected['params'].get('sessionId', ''), \
+                f'{codec.backend}: target event {frame}'
+
+
+def full_decode(codec: CDPCodec, frames: List[str]) -> None:
+    for frame in frames:
+        message = codec.loads(frame)
+
+        if message.get('method', None) in TARGET_EVENTS:
+            message['params']['targetInfo']['targetId']
+
+
+def lazy_decode(codec: CDPCodec, frames: List[str]) -> None:
+    events = EventPipeline()
+
+    for frame in frames:
+        method = codec.peek_method(frame)
+
+        if method is UNKNOWN:
+            method = codec.loads(frame).get('method', None)
+        elif events.wants(method):
+            codec.loads(frame)
+
+        if method in TARGET_EVENTS:
+            codec.decode_target_event(frame).params.targetInfo.targetId
+
+
+def available_backends() -> List[str]:
+    backends = []
+
+    for backend in ('json', 'orjson', 'msgspec'):
+        try:
+            CDPCodec(backend)
+        except AssertionError:
+            continue
+
+        backends.append(backend)
+
+    return backends
+
+
+def run(frames: List[str]) -> List[dict]:
+    results = []
+
+    for backend in available_backends():
+        codec = CDPCodec(backend)
+        check(codec, frames)
+
+        for mode, handle in (('full', full_decode), ('lazy', lazy_decode)):
+            started, cpu_started = perf_counter(), process_time()
+            handle(codec, frames)
+            wall, cpu = perf_counter() - started, process_time() - cpu_started
+
+            results.append({
+                'name': f'{backend}_{mode}',
+                'frames': len(frames),
+                'wall_s': round(wall, 6),
+                'cpu_us_per_frame': round(cpu / len(frames) * 1e6, 3),
+                'frames_per_s': round(len(frames) / wall) if wall else None
+            })
+
+    return results
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--frames', type=int, default=100_000)
+    parser.add_argument('--recording', help='file written by CDPRecorder')
+    args = parser.parse_args()
+
+    print(dumps(run(
+        recorded_frames(args.recording) if args.recording
+        else synthetic_frames(args.frames)
+    ), indent=4))
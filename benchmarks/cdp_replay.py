@@ -0,0 +1,156 @@
+'''
+    Offline `ChromeDebugg` benchmark against the fake DevTools server.
+
+    The server runs in a child process, so CPU time of this process is the
+    CPU time of the debugger (all its threads). Reports attach latency,
+    messages per second and CPU per message. No browser or network needed.
+
+    Usage: python -m benchmarks.cdp_replay [--recording file] [--realtime]
+        [--targets 10] [--events 200] [--types page,iframe,other]
+'''
+
+
+from argparse import ArgumentParser
+from asyncio import new_event_loop, run, run_coroutine_threadsafe
+from json import dumps
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import Connection
+from tempfile import mkdtemp
+from threading import Thread
+from time import process_time
+from typing import List
+
+from benchmarks.devtools_server import FakeDevTools, Frame, synthetic_session
+from chromedebugg import ChromeDebugg
+from helpers.masking import SpoofingTemplates
+from helpers.recorder import read_recording
+
+
+class StaticMasking:
+    '''
+        Fixed emulations of the same shape as `MaskingTools`, keeps geo
+        lookups out of the measurement
+    '''
+
+    def get_emulations(self, spoofing: dict) -> List[dict]:
+        return [
+            {
+                'method': 'Emulation.setGeolocationOverride',
+                'params': {'latitude': 25.2048, 'longitude': 55.2708, 'accuracy': 20}
+            },
+            {
+                'method': 'Emulation.setTimezoneOverride',
+                'params': {'timezoneId': 'Asia/Dubai'}
+            },
+            {
+                'method': 'Emulation.setLocaleOverride',
+                'params': {'locale': 'ar_AE'}
+            },
+            {
+                'method': 'Emulation.setUserAgentOverride',
+                'params': {'userAgent': '', 'acceptLanguage': 'ar-AE,ar'}
+            },
+            {
+                'method': 'Emulation.setHardwareConcurrencyOverride',
+                'params': {'hardwareConcurrency': 8}
+            },
+            {
+                'method': 'Runtime.evaluate',
+                'params': {
+                    'expression': SpoofingTemplates().ram(8),
+                    'includeCommandLineAPI': True
+                }
+            }
+        ]
+
+
+class ReplayDebugg(ChromeDebugg):
+    '''
+        `ChromeDebugg` attached to an already running DevTools endpoint
+    '''
+
+    def __init__(self, port: int, **kwargs) -> None:
+        super().__init__({
+            'path': mkdtemp(prefix='marionette-replay-'),
+            'proxy': 'direct://',
+            'spoofing': {}
+        }, StaticMasking(), **kwargs)
+
+        self._replay_port: int = port
+
+    async def _open_chrome(self) -> str:
+        self._port = self._replay_port
+
+
+def _serve(frames: List[Frame], realtime: bool, conn: Connection) -> None:
+    async def serve() -> None:
+        server = FakeDevTools(frames, realtime)
+        conn.send(await server.start())
+
+        await server.done.wait()
+        conn.send(server.stats())
+
+        await server.stop()
+
+    run(serve())
+
+
+def replay(frames: List[Frame], realtime: bool = False, timeout: float = 120) -> dict:
+    '''
+        Run one `ChromeDebugg` session against a fresh replay server
+
+        :param frames: list - recording frames
+        :param realtime: bool - keep original timing
+        :param timeout: float - max session time in seconds
+
+        Return `dict` - server stats plus debugger CPU and attach stages
+    '''
+
+    parent, child = Pipe()
+    server = Process(target=_serve, args=(frames, realtime, child), daemon=True)
+    server.start()
+
+    port = parent.recv()
+
+    loop = new_event_loop()
+    Thread(target=loop.run_forever, name='ReplayDebugg', daemon=True).start()
+
+    debugg = ReplayDebugg(port)
+
+    cpu_started = process_time()
+    session = run_coroutine_threadsafe(debugg.main(), loop)
+
+    assert parent.poll(timeout), "Replay did not finish in time"
+    stats = parent.recv()
+    cpu = process_time() - cpu_started
+
+    server.join(5)
+    session.result(timeout)
+
+    stats['debugger_cpu_s'] = round(cpu, 6)
+    stats['cpu_us_per_msg'] = round(
+        cpu / stats['frames_delivered'] * 1e6, 3
+    ) if stats['frames_delivered'] else None
+    stats['attach_stages'] = debugg.metrics.snapshot()
+    stats['debugger_targets'] = debugg.targets.status()
+
+    return stats
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--recording', help='file written by CDPRecorder')
+    parser.add_argument('--realtime', action='store_true')
+    parser.add_argument('--targets', type=int, default=10)
+    parser.add_argument('--events', type=int, default=200)
+    parser.add_argument(
+        '--types', default='page,iframe,service_worker,shared_worker',
+        help='target types of the synthetic session, round robin'
+    )
+    args = parser.parse_args()
+
+    print(dumps(replay(
+        list(read_recording(args.recording)) if args.recording
+        else synthetic_session(args.targets, args.events, tuple(args.types.split(','))),
+        args.realtime
+    ), indent=4))
@@ -0,0 +1,389 @@
+'''
+    Fake Chrome DevTools server (aiohttp) replaying recorded CDP traffic.
+
+    Serves `/json/version`, the browser socket and `/devtools/page/<tid>`
+    sockets. Events of a recording (or a synthetic session) are replayed
+    with the original timing or as fast as possible, every command of the
+    debugger is answered with an empty result. Like Chrome, target events
+    start after `Target.setAutoAttach` and honour its `filter`.
+
+    Usage: python -m benchmarks.devtools_server [--recording file] [--realtime]
+'''
+
+
+from argparse import ArgumentParser
+from asyncio import Event, create_task, gather, run, sleep, wait_for
+from json import dumps, loads
+from socket import socket
+from statistics import median, quantiles
+from time import perf_counter
+from typing import Dict, List, Tuple
+
+from aiohttp import WSMsgType, web
+
+from helpers.recorder import read_recording
+
+
+TARGET_EVENTS: tuple = ('Target.attachedToTarget', 'Target.targetCreated')
+
+Frame = Tuple[float, str, str, str]
+
+
+def synthetic_session(
+    targets: int = 10, events: int = 200,
+    types: tuple = ('page', 'iframe', 'service_worker', 'shared_worker')
+) -> List[Frame]:
+    '''
+        Session shaped like a real page load, for runs without a recording
+
+        :param targets: int - number of targets
+        :param events: int - `Network.*` events per target
+        :param types: tuple - target types, assigned round robin
+
+        Return `List[Frame]`
+    '''
+
+    frames = []
+
+    def event(method: str, params: dict) -> str:
+        return dumps({'method': method, 'params': params}, separators=(',', ':'))
+
+    for i in range(targets):
+        tid = f'{i:032X}'
+        info = {
+            'targetId': tid, 'type': types[i % len(types)],
+            'title': '', 'url': f'https://example.com/{i}', 'attached': True
+        }
+
+        frames.append((i * 0.05, 'browser', 'in', event(
+            'Target.targetCreated', {'targetInfo': info}
+        )))
+        frames.append((i * 0.05 + 0.001, 'browser', 'in', event(
+            'Target.attachedToTarget', {
+                'sessionId': f'S{tid}', 'targetInfo': info,
+                'waitingForDebugger': True
+            }
+        )))
+
+        frames.append((0.0, tid, 'in', event(
+            'Runtime.executionContextCreated', {
+                'context': {'id': 1, 'origin': info['url'], 'name': ''}
+            }
+        )))
+
+        for j in range(events):
+            frames.append((0.002 * (j + 1), tid, 'in', event(
+                ('Network.requestWillBeSent', 'Network.responseReceived',
+                 'Network.dataReceived', 'Network.loadingFinished')[j % 4], {
+                    'requestId': f'{i}.{j // 4}', 'timestamp': 1000.0 + j,
+                    'request': {'url': f'https://example.com/{i}/{j // 4}.js'},
+                    'encodedDataLength': 1024
+                }
+            )))
+
+        frames.append((0.002 * (events + 1), tid, 'in', event(
+            'Inspector.detached', {'reason': 'target_closed'}
+        )))
+
+    return frames
+
+
+class FakeDevTools:
+    '''
+        Replay server. One browser connection replays the whole session.
+
+        :param frames: list - `(offset_s, channel, direction, frame)`
+        :param realtime: bool - keep original timing instead of max speed
+        :param host: str - listen host
+        :param port: int - listen port, 0 for random
+        :param target_timeout: float - max wait for attached targets to finish
+        :param keep_open: bool - after the replay keep browser sockets open
+            till the client closes them, so browsers stay live
+    '''
+
+    def __init__(
+        self, frames: List[Frame], realtime: bool = False,
+        host: str = '127.0.0.1', port: int = 0, target_timeout: float = 10,
+        keep_open: bool = False
+    ) -> None:
+        self._realtime: bool = realtime
+        self._keep_open: bool = keep_open
+        self._target_timeout: float = target_timeout
+        self._host: str = host
+        self._port: int = port
+        self._runner: web.AppRunner = None
+
+        self._browser: List[Tuple[float, str]] = []
+        self._targets: Dict[str, List[Tuple[float, str]]] = {}
+
+        for offset, channel, direction, frame in frames:
+            # Only events are replayed, replies are generated per command
+            if direction != 'in' or not frame.startswith('{"method"'):
+                continue
+
+            if channel == 'browser':
+                self._browser.append((offset, frame))
+            else:
+                self._targets.setdefault(channel, []).append((offset, frame))
+
+        self.announced: Dict[str, float] = {}
+        self.resumed: Dict[str, float] = {}
+        self.target_types: Dict[str, str] = {}
+        self.commands: Dict[str, int] = {}
+        # Target commands received before `Runtime.runIfWaitingForDebugger`
+        self.before_resume: Dict[str, int] = {}
+        self.delivered: int = 0
+        self.first_frame: float = None
+        self.last_frame: float = None
+
+        self.suppressed: int = 0
+        self._filter: List[dict] = [
+            {'type': 'browser', 'exclude': True}, {'type': 'tab', 'exclude': True}, {}
+        ]
+        self._auto_attach: Event = Event()
+
+        self._finished: Dict[str, Event] = {}
+        self.done: Event = Event()
+
+    @property
+    def port(self) -> int:
+        return self._port
+
+    async def start(self) -> int:
+        '''
+            Start server
+
+            Return `int` - listen port
+        '''
+
+        app = web.Application()
+        app.router.add_get('/json/version', self._version)
+        app.router.add_get('/devtools/browser/{bid}', self._browser_socket)
+        app.router.add_get('/devtools/page/{tid}', self._target_socket)
+
+        self._runner = web.AppRunner(app, handle_signals=False)
+        await self._runner.setup()
+
+        sock = socket()
+        sock.bind((self._host, self._port))
+        self._port = sock.getsockname()[1]
+
+        await web.SockSite(self._runner, sock).start()
+
+        return self._port
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _version(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            'Browser': 'FakeDevTools/1.0',
+            'webSocketDebuggerUrl': f'ws://{self._host}:{self._port}/devtools/browser/replay'
+        })
+
+    async def _replay(
+        self, ws: web.WebSocketResponse, frames: List[Tuple[float, str]]
+    ) -> None:
+        started = perf_counter()
+        base = frames[0][0] if frames else 0.0
+
+        for offset, frame in frames:
+            if self._realtime and (
+                delay := (offset - base) - (perf_counter() - started)
+            ) > 0:
+                await sleep(delay)
+
+            if ws.closed:
+                return
+
+            if frame.startswith('{"method":"Target.'):
+                message = loads(frame)
+
+                if message['method'] in TARGET_EVENTS:
+                    info = message['params']['targetInfo']
+
+                    if not self._included(info.get('type', '')):
+                        self.suppressed += 1
+                        continue
+
+                    self.announced.setdefault(info['targetId'], perf_counter())
+                    self.target_types[info['targetId']] = info.get('type', '')
+                    self._finished.setdefault(info['targetId'], Event())
+
+            await ws.send_str(frame)
+
+            self.delivered += 1
+            self.last_frame = perf_counter()
+            self.first_frame = self.first_frame or self.last_frame
+
+    def _included(self, target_type: str) -> bool:
+        '''
+            `Target.TargetFilter`: first matching entry wins
+        '''
+
+        for entry in self._filter:
+            if entry.get('type', target_type) == target_type:
+                return not entry.get('exclude', False)
+
+        return False
+
+    async def _answer(self, ws: web.WebSocketResponse, channel: str) -> None:
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                continue
+
+            command = loads(msg.data)
+            method = command.get('method', '')
+            params = command.get('params', {})
+
+            # Flattened session command on the browser socket: "S<tid>"
+            target = command['sessionId'][1:] if 'sessionId' in command else channel
+
+            self.commands[channel] = self.commands.get(channel, 0) + 1
+
+            if channel != 'browser' and target not in self.resumed \
+                    and method != 'Runtime.runIfWaitingForDebugger':
+                self.before_resume[target] = self.before_resume.get(target, 0) + 1
+
+            if method == 'Target.setAutoAttach':
+                self._filter = params.get('filter', self._filter)
+                self._auto_attach.set()
+            elif method == 'Runtime.runIfWaitingForDebugger':
+                self.resumed.setdefault(target, perf_counter())
+            elif method == 'Target.detachFromTarget':
+                self._finished.setdefault(params.get('sessionId', ' ')[1:], Event()).set()
+
+            try:
+                await ws.send_str(dumps({'id': command.get('id', 0), 'result': {}}))
+            except ConnectionResetError:
+                # Client closed the socket while the command was answered
+                return
+
+            if method == 'Browser.close':
+                await ws.close()
+
+    async def _browser_socket(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse(max_msg_size=0)
+        await ws.prepare(request)
+
+        answer = create_task(self._answer(ws, 'browser'))
+
+        try:
+            await wait_for(self._auto_attach.wait(), self._target_timeout)
+        except TimeoutError:
+            pass
+
+        await self._replay(ws, self._browser)
+
+        try:
+            await wait_for(
+                gather(*(event.wait() for event in self._finished.values())),
+                self._target_timeout
+            )
+        except TimeoutError:
+            pass
+
+        if self._keep_open:
+            await answer
+
+        await ws.close()
+        answer.cancel()
+
+        self.done.set()
+
+        return ws
+
+    async def _target_socket(self, request: web.Request) -> web.WebSocketResponse:
+        tid = request.match_info['tid']
+
+        ws = web.WebSocketResponse(max_msg_size=0)
+        await ws.prepare(request)
+
+        answer = create_task(self._answer(ws, tid))
+
+        # Paused target: nothing is emitted before the debugger resumes it
+        while tid not in self.resumed and not ws.closed:
+            await sleep(0.001)
+
+        frames = self._targets.get(tid, [])
+        await self._replay(ws, frames)
+
+        if not frames or not frames[-1][1].startswith('{"method":"Inspector.'):
+            await ws.send_str(dumps({
+                'method': 'Inspector.detached', 'params': {'reason': 'replay_end'}
+            }))
+
+        await answer
+        self._finished.setdefault(tid, Event()).set()
+
+        return ws
+
+    def _per_type(self, counts: Dict[str, int]) -> Dict[str, float]:
+        '''
+            Mean of per-target counts by target type
+        '''
+
+        by_type = {}
+
+        for tid, count in counts.items():
+            by_type.setdefault(self.target_types.get(tid, ''), []).append(count)
+
+        return {
+            target_type: round(sum(values) / len(values), 2)
+            for target_type, values in sorted(by_type.items())
+        }
+
+    def stats(self) -> dict:
+        '''
+            Attach latency (announce -> `Runtime.runIfWaitingForDebugger`)
+            and delivery stats of the replay
+
+            Return `dict`
+        '''
+
+        latencies = [
+            (self.resumed[tid] - announced) * 1000
+            for tid, announced in self.announced.items() if tid in self.resumed
+        ]
+        duration = (self.last_frame or 0) - (self.first_frame or 0)
+
+        return {
+            'targets': len(self.announced),
+            'attached': len(latencies),
+            'attach_latency_ms': {
+                'p50': round(median(latencies), 3),
+                'p95': round(quantiles(latencies, n=20, method='inclusive')[-1], 3)
+                if len(latencies) > 1 else round(latencies[0], 3),
+                'max': round(max(latencies), 3)
+            } if latencies else {},
+            'suppressed_by_filter': self.suppressed,
+            'frames_delivered': self.delivered,
+            'commands_received': sum(self.commands.values()),
+            'commands_before_resume': self._per_type(self.before_resume),
+            'duration_s': round(duration, 6),
+            'msg_per_s': round(self.delivered / duration) if duration else None
+        }
+
+
+async def serve(frames: List[Frame], realtime: bool, port: int) -> None:
+    server = FakeDevTools(frames, realtime, port=port)
+    print(f'FakeDevTools listening on 127.0.0.1:{await server.start()}')
+
+    await server.done.wait()
+    print(dumps(server.stats(), indent=4))
+
+    await server.stop()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--recording', help='file written by CDPRecorder')
+    parser.add_argument('--realtime', action='store_true')
+    parser.add_argument('--port', type=int, default=9222)
+    args = parser.parse_args()
+
+    run(serve(
+        list(read_recording(args.recording)) if args.recording
+        else synthetic_session(), args.realtime, args.port
+    ))
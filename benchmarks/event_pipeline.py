@@ -0,0 +1,167 @@
+'''
+    Network event throughput of the CDP event pipeline.
+
+    Compares the old per-message `print()` with `EventPipeline` using
+    stdout logging on and off, sampling and file sinks.
+
+    Checked: every message is dispatched, stdout logging off writes
+    nothing, and the sink files read back to exactly the messages the
+    sampling keeps (every n-th per method), in order.
+
+    Usage: python -m benchmarks.event_pipeline [--messages 100000] [--tty]
+'''
+
+
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from json import dumps, loads
+from os import devnull, remove
+from struct import calcsize, unpack_from
+from sys import stdout
+from tempfile import mkstemp
+from time import perf_counter, process_time
+from typing import Callable, List
+
+from helpers.events import (
+    DEBUG, BinarySink, EventPipeline, NDJSONSink, StdoutSink
+)
+
+
+def network_events(count: int) -> List[dict]:
+    '''
+        Synthetic `Network.*` traffic, shaped like a real page load
+
+        :param count: int - number of messages
+
+        Return `List[dict]`
+    '''
+
+    methods = (
+        'Network.requestWillBeSent', 'Network.responseReceived',
+        'Network.dataReceived', 'Network.loadingFinished'
+    )
+
+    return [{
+        'method': methods[i % len(methods)],
+        'params': {
+            'requestId': f'{i // 4}.1',
+            'timestamp': 1000.0 + i,
+            'request': {'url': f'https://example.com/asset/{i}.js'},
+            'encodedDataLength': 1024 + i % 4096
+        }
+    } for i in range(count)]
+
+
+def sampled(messages: List[dict], rate: float) -> List[dict]:
+    '''
+        Messages kept by `EventPipeline` sampling at `rate`
+
+        Return `List[dict]`
+    '''
+
+    every, seen, kept = max(1, round(1 / rate)), {}, []
+
+    for message in messages:
+        count = seen.get(message['method'], 0)
+        seen[message['method']] = count + 1
+
+        if not count % every:
+            kept.append(message)
+
+    return kept
+
+
+def read_sink(name: str, path: str) -> List[dict]:
+    '''
+        Messages written by `NDJSONSink` ("ndjson") or `BinarySink` ("binary")
+
+        Return `List[dict]`
+    '''
+
+    with open(path, 'rb') as file:
+        data = file.read()
+
+    if name == 'ndjson':
+        return [loads(line)['msg'] for line in data.splitlines()]
+
+    messages, offset, size = [], 0, calcsize(BinarySink.HEADER)
+
+    while offset < len(data):
+        _, _, source_len, msg_len = unpack_from(BinarySink.HEADER, data, offset)
+        offset += size + source_len
+        messages.append(loads(data[offset:offset + msg_len]))
+        offset += msg_len
+
+    return messages
+
+
+def measure(name: str, messages: List[dict], handle: Callable) -> dict:
+    started, cpu_started = perf_counter(), process_time()
+
+    for message in messages:
+        handle(message)
+
+    wall, cpu = perf_counter() - started, process_time() - cpu_started
+
+    return {
+        'name': name,
+        'messages': len(messages),
+        'wall_s': round(wall, 6),
+        'cpu_s': round(cpu, 6),
+        'msg_per_s': round(len(messages) / wall) if wall else None
+    }
+
+
+def run(count: int, stream) -> List[dict]:
+    messages = network_events(count)
+    results = []
+
+    with redirect_stdout(stream):
+        results.append(measure(
+            'legacy_print', messages,
+            lambda msg: print(f'Attached [TID] normal: {msg}')
+        ))
+
+    for name, pipeline in (
+        ('pipeline_stdout_on', EventPipeline(DEBUG, sinks=[StdoutSink(stream)])),
+        ('pipeline_stdout_off', EventPipeline())
+    ):
+        results.append(measure(name, messages, lambda msg: pipeline.dispatch(msg, 'TID')))
+
+        written = len(messages) if name == 'pipeline_stdout_on' else 0
+        assert pipeline.dispatched == len(messages) and pipeline.written == written, \
+            f'{name}: {pipeline.dispatched} dispatched, {pipeline.written} written'
+
+    for name, sink_cls in (('ndjson', NDJSONSink), ('binary', BinarySink)):
+        for rate in (1.0, 0.01):
+            _, path = mkstemp(suffix=f'.{name}')
+
+            pipeline = EventPipeline(DEBUG, rate, [sink_cls(path)])
+            results.append(measure(
+                f'pipeline_{name}_sample_{rate}', messages,
+                lambda msg: pipeline.dispatch(msg, 'TID')
+            ))
+            pipeline.close()
+
+            assert read_sink(name, path) == sampled(messages, rate), \
+                f'{name} sink at sample rate {rate} lost or changed messages'
+
+            remove(path)
+
+    return results
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=100_000)
+    parser.add_argument(
+        '--tty', action='store_true',
+        help='write stdout logging to the real stdout instead of /dev/null'
+    )
+    args = parser.parse_args()
+
+    if args.tty:
+        print(dumps(run(args.messages, stdout), indent=4))
+    else:
+        with open(devnull, 'w', encoding='utf-8') as null:
+            print(dumps(run(args.messages, null), indent=4))
@@ -0,0 +1,115 @@
+'''
+    `MaskingTools` throughput: country lookups per point and in batches,
+    and `get_emulations` per profile (geo lookup, timezone lookup and
+    overrides). Uses the synthetic country file of `bulk_import` unless
+    `--geo-file` is given.
+
+    Checked before timing: per point lookups give the batch results, every
+    point has a country in the synthetic file, and emulations carry the
+    profile's coordinates, hardware and its country's locale.
+
+    Usage: python -m benchmarks.masking_throughput [--points 20000]
+        [--countries 250] [--vertices 400] [--geo-file helpers/WORLD.geojson]
+'''
+
+
+from argparse import ArgumentParser
+from json import dumps
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import perf_counter
+from typing import Callable, Dict, List, Optional
+
+from benchmarks.bulk_import import country_file, profile_rows
+from helpers.masking import MaskingTools
+
+
+def measure(count: int, call: Callable[[], object]) -> dict:
+    started = perf_counter()
+    call()
+    seconds = perf_counter() - started
+
+    return {
+        'calls': count,
+        'seconds': round(seconds, 3),
+        'per_second': round(count / seconds),
+        'us_per_call': round(seconds / count * 1e6, 2)
+    }
+
+
+def check_emulations(emulations: List[dict], profile: dict, country: dict) -> None:
+    params: Dict[str, dict] = {item['method']: item['params'] for item in emulations}
+
+    assert params['Emulation.setLocaleOverride']['locale'] == country['locale'] and \
+        params['Emulation.setUserAgentOverride']['acceptLanguage'] == country['accept-lang'], \
+        f'Wrong locale for {profile}'
+    assert (
+        params['Emulation.setGeolocationOverride']['latitude'],
+        params['Emulation.setGeolocationOverride']['longitude']
+    ) == (profile['geo']['lat'], profile['geo']['lon']), f'Wrong geolocation for {profile}'
+    assert params['Emulation.setHardwareConcurrencyOverride']['hardwareConcurrency'] == \
+        profile['hardware']['cpu'], f'Wrong CPU count for {profile}'
+
+
+def main(points: int, countries: int, vertices: int, geo_file: Optional[str] = None) -> dict:
+    report = {'points': points}
+    root = mkdtemp(prefix='marionette-masking-')
+
+    try:
+        if geo_file is None:
+            geo_file = f'{root}/world.geojson'
+            report['countries'] = country_file(geo_file, countries, vertices)
+
+        started = perf_counter()
+        masking = MaskingTools(geo_file=geo_file)
+        report['load_seconds'] = round(perf_counter() - started, 3)
+    finally:
+        rmtree(root, ignore_errors=True)
+
+    rows = profile_rows(points)
+    coordinates = [(row['lat'], row['lon']) for row in rows]
+    countries = masking.find_country_specs_batch(coordinates)
+
+    assert [masking.find_country_specs(lat, lon) for lat, lon in coordinates] == countries, \
+        'Batch lookup differs from per point lookups'
+    assert 'countries' not in report or all(countries), 'Points without a country'
+
+    # Points in the sea of a real country file match no country,
+    # `get_emulations` needs one
+    spoofing, found = [], []
+
+    for row, country in zip(rows, countries):
+        if country:
+            spoofing.append({
+                'geo': {'lat': row['lat'], 'lon': row['lon']},
+                'hardware': {'cpu': row['cpu'], 'ram': row['ram']}
+            })
+            found.append(country)
+
+    for profile, country in zip(spoofing, found):
+        check_emulations(masking.get_emulations(profile), profile, country)
+
+    report['find_country_specs'] = measure(points, lambda: [
+        masking.find_country_specs(lat, lon) for lat, lon in coordinates
+    ])
+    report['find_country_specs_batch'] = measure(
+        points, lambda: masking.find_country_specs_batch(coordinates)
+    )
+    report['get_emulations'] = measure(len(spoofing), lambda: [
+        masking.get_emulations(profile) for profile in spoofing
+    ])
+
+    return report
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--points', type=int, default=20000)
+    parser.add_argument('--countries', type=int, default=250)
+    parser.add_argument('--vertices', type=int, default=400, help='per polygon edge')
+    parser.add_argument('--geo-file', help='real country file instead of the synthetic one')
+    args = parser.parse_args()
+
+    print(dumps(
+        main(args.points, args.countries, args.vertices, args.geo_file), indent=4
+    ))
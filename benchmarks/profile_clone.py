@@ -0,0 +1,180 @@
+'''
+    Profile creation benchmark: empty dir vs `shutil.copytree` vs template
+    clone (reflink / copy_file_range / copy).
+
+    With `--chrome` the first launch (until CDP is online) of an empty and
+    a cloned profile is measured too; needs Chrome from chrome_settings.json.
+
+    Checked: the template and a clone of it hold the same files with the
+    same content as the source, and no file is a hardlink (Chrome writes
+    cache files in place, a shared inode leaks writes between profiles).
+
+    Usage: python -m benchmarks.profile_clone [--files 2000] [--chrome]
+'''
+
+
+from argparse import ArgumentParser
+from asyncio import run
+from json import dumps
+from os import lstat, makedirs, urandom, walk
+from os.path import join, relpath
+from shutil import copytree, rmtree
+from tempfile import mkdtemp
+from time import perf_counter
+from typing import Callable, List
+
+from benchmarks.cdp_replay import StaticMasking
+from helpers.launcher import BatchLauncher
+from helpers.storage import ProfileTemplates
+
+
+def warmed_profile(path: str, files: int) -> None:
+    '''
+        Synthetic warmed user-data-dir: cache entries plus a few databases
+
+        :param path: str - profile directory
+        :param files: int - number of cache entries
+    '''
+
+    cache = join(path, 'Default', 'Cache', 'Cache_Data')
+    code_cache = join(path, 'Default', 'Code Cache', 'js')
+
+    makedirs(cache)
+    makedirs(code_cache)
+
+    for i in range(files):
+        with open(join(cache if i % 3 else code_cache, f'{i:016x}_0'), 'wb') as file:
+            file.write(urandom(4096 + (i * 7919) % 61440))
+
+    for name in ('History', 'Cookies', 'Web Data', 'Preferences', 'Local State'):
+        with open(join(path, 'Default', name), 'wb') as file:
+            file.write(urandom(256 * 1024))
+
+
+def verify_copy(src: str, dst: str, ignore: tuple = ()) -> int:
+    '''
+        Assert `dst` holds the files of `src` with the same content, each
+        its own inode without other links
+
+        :param ignore: tuple - relative paths only `dst` has
+
+        Return `int` - number of files compared
+    '''
+
+    def files(root: str) -> List[str]:
+        return sorted(
+            relpath(join(parent, name), root)
+            for parent, _, names in walk(root) for name in names
+        )
+
+    expected = files(src)
+    assert [name for name in files(dst) if name not in ignore] == expected, \
+        f'{dst}: files differ from {src}'
+
+    for name in expected:
+        original, copy = lstat(join(src, name)), lstat(join(dst, name))
+
+        assert copy.st_nlink == 1 and copy.st_ino != original.st_ino, \
+            f'{name}: hardlinked into {dst}'
+
+        with open(join(src, name), 'rb') as a, open(join(dst, name), 'rb') as b:
+            assert a.read() == b.read(), f'{name}: content differs in {dst}'
+
+    return len(expected)
+
+
+def measure(name: str, create: Callable[[str], object], root: str, runs: int) -> dict:
+    times = []
+    extra = None
+
+    for i in range(runs):
+        dst = join(root, f'{name}-{i}')
+
+        started = perf_counter()
+        extra = create(dst)
+        times.append(perf_counter() - started)
+
+        rmtree(dst)
+
+    return {
+        'name': name,
+        'runs': runs,
+        'best_s': round(min(times), 6),
+        'mean_s': round(sum(times) / runs, 6),
+        'stats': extra if isinstance(extra, dict) else None
+    }
+
+
+async def first_launch(paths: List[str]) -> List[dict]:
+    '''
+        Launch real Chrome for each profile dir and close it once online
+    '''
+
+    launcher = BatchLauncher(StaticMasking(), concurrency=1, stagger=0)
+    results = []
+
+    for path in paths:
+        uuid = path.rsplit('/', 1)[-1]
+
+        results.append(await launcher.launch(uuid, {
+            'path': path, 'proxy': 'direct://', 'spoofing': {}
+        }))
+        await launcher.stop(uuid)
+        await launcher.wait_closed()
+
+    return results
+
+
+def main(files: int, runs: int, chrome: bool) -> dict:
+    root = mkdtemp(prefix='marionette-clone-')
+    source = join(root, 'warmed')
+
+    warmed_profile(source, files)
+
+    templates = ProfileTemplates(join(root, '.templates'))
+
+    started = perf_counter()
+    snapshot_stats = templates.snapshot(source, 'warmed')
+    snapshot_s = perf_counter() - started
+
+    results = {
+        'files': files,
+        'snapshot': {'seconds': round(snapshot_s, 6), 'stats': snapshot_stats},
+        'create': [
+            measure('empty', lambda dst: makedirs(dst), root, runs),
+            measure('copytree', lambda dst: copytree(source, dst), root, runs),
+            measure(
+                'template_clone',
+                lambda dst: templates.clone('warmed', dst), root, runs
+            )
+        ]
+    }
+
+    checked = join(root, 'checked')
+    templates.clone('warmed', checked)
+
+    results['verified_files'] = verify_copy(
+        source, join(root, '.templates', 'warmed'), (ProfileTemplates.META_FILE,)
+    )
+    assert verify_copy(source, checked) == results['verified_files']
+
+    if chrome:
+        empty, cloned = join(root, 'launch-empty'), join(root, 'launch-cloned')
+        makedirs(empty)
+        templates.clone('warmed', cloned)
+
+        results['first_launch'] = run(first_launch([empty, cloned]))
+
+    rmtree(root)
+
+    return results
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--files', type=int, default=2000)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--chrome', action='store_true')
+    args = parser.parse_args()
+
+    print(dumps(main(args.files, args.runs, args.chrome), indent=4))
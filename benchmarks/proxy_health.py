@@ -0,0 +1,174 @@
+'''
+    Proxy health-check benchmark: sequential vs concurrent probing of
+    stand-in SOCKS5 upstreams (some delayed, some failing, some hanging
+    past the timeout, some down).
+
+    Checked: every upstream is classified as expected (failing, hanging
+    and refused ones dead, delayed ones alive with at least the delay as
+    latency), fresh cached results are reused without probing, probes in
+    flight never exceed `concurrency`, and the scheduler probes every
+    distinct proxy once per interval.
+
+    Usage: python -m benchmarks.proxy_health [--proxies 200] [--concurrency 32]
+        [--delay 0.05] [--timeout 0.5]
+'''
+
+
+from argparse import ArgumentParser
+from asyncio import Semaphore, create_task, run, sleep
+from json import dumps
+from time import perf_counter
+from typing import Dict
+
+from benchmarks.socks_stub import EchoServer, StubSocks
+from helpers.proxy_health import ProbeResult, ProxyHealth
+
+
+class PeakSemaphore(Semaphore):
+    '''
+        Semaphore recording the most holders at once
+    '''
+
+    def __init__(self, value: int) -> None:
+        super().__init__(value)
+
+        self.active: int = 0
+        self.peak: int = 0
+
+    async def acquire(self) -> bool:
+        await super().acquire()
+
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+
+        return True
+
+    def release(self) -> None:
+        self.active -= 1
+        super().release()
+
+
+class CountingHealth(ProxyHealth):
+    '''
+        `ProxyHealth` counting probes per proxy and probes in flight
+    '''
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+
+        self._semaphore: PeakSemaphore = PeakSemaphore(self._semaphore._value)
+        self.probes: Dict[str, int] = {}
+
+    async def probe(self, proxy: str) -> ProbeResult:
+        self.probes[proxy] = self.probes.get(proxy, 0) + 1
+
+        return await super().probe(proxy)
+
+
+async def scheduled_rounds(health: CountingHealth, urls: list, interval: float) -> int:
+    '''
+        Run the scheduler for a few intervals
+
+        Return `int` - probes per distinct proxy, same for all of them
+    '''
+
+    health._interval = interval
+
+    scheduler = create_task(health.run(lambda: urls))
+    await sleep(interval * 3.5)
+    scheduler.cancel()
+
+    counts = set(health.probes.values())
+    assert set(health.probes) == set(urls) and counts == {4}, \
+        f'Not one probe per proxy and interval: {health.probes}'
+
+    return counts.pop()
+
+
+async def main(proxies: int, concurrency: int, delay: float, timeout: float) -> dict:
+    echo = EchoServer()
+    await echo.start()
+
+    stubs, expected = [], {}
+
+    for i in range(proxies):
+        hangs = i % 25 == 7
+        stub = StubSocks(
+            delay=timeout * 2 if hangs else delay if i % 4 == 1 else 0.0,
+            fail=i % 10 == 3
+        )
+        await stub.start()
+
+        stubs.append(stub)
+        expected[stub.url] = 'TimeoutError' if hangs else 'failed' if stub.fail else \
+            'delayed' if stub.delay else 'alive'
+
+    urls = [stub.url for stub in stubs]
+    # Closed ports: refused connections, duplicates are probed once
+    refused = 'socks5://127.0.0.1:1'
+    urls += [refused] * (proxies // 20)
+    expected[refused] = 'refused'
+
+    results = {'proxies': len(urls), 'concurrency': concurrency, 'delay_s': delay}
+
+    for name, limit in (('sequential', 1), ('concurrent', concurrency)):
+        health = CountingHealth(f'127.0.0.1:{echo.port}', limit, timeout=timeout)
+
+        started = perf_counter()
+        checked = await health.check_all(urls, force=True)
+        elapsed = perf_counter() - started
+
+        for url, kind in expected.items():
+            result = checked[url]
+
+            assert result.alive == (kind in ('alive', 'delayed')), f'{kind} upstream: {result}'
+            assert kind != 'delayed' or result.latency_ms >= delay * 1000, \
+                f'Delayed upstream too fast: {result}'
+            assert kind != 'TimeoutError' or result.error == 'TimeoutError', \
+                f'Hanging upstream: {result}'
+
+        assert health.probes == dict.fromkeys(expected, 1), 'Proxies probed more than once'
+        assert health._semaphore.peak <= limit, 'Concurrency exceeded'
+
+        started = perf_counter()
+        cached_result = await health.check_all(urls)
+        cached = perf_counter() - started
+
+        assert cached_result == checked, 'Cached results changed'
+        assert health.probes == dict.fromkeys(expected, 1), 'Fresh results probed again'
+
+        latencies = sorted(r.latency_ms for r in checked.values() if r.alive)
+
+        results[name] = {
+            'seconds': round(elapsed, 4),
+            'cached_seconds': round(cached, 6),
+            'alive': len(latencies),
+            'dead': len(checked) - len(latencies),
+            'peak_in_flight': health._semaphore.peak,
+            'latency_ms_p50': latencies[len(latencies) // 2] if latencies else None
+        }
+
+    assert results['concurrent']['peak_in_flight'] > 1, 'Probes not concurrent'
+
+    health = CountingHealth(f'127.0.0.1:{echo.port}', concurrency, timeout=timeout)
+    sample = [stub.url for stub in stubs[:20] if expected[stub.url] == 'alive'] + [refused] * 3
+    results['scheduler_probes_per_proxy'] = await scheduled_rounds(
+        health, sample, timeout + 0.2
+    )
+
+    for stub in stubs:
+        await stub.stop()
+    await echo.stop()
+
+    return results
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--proxies', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--delay', type=float, default=0.05)
+    parser.add_argument('--timeout', type=float, default=0.5)
+    args = parser.parse_args()
+
+    print(dumps(run(main(args.proxies, args.concurrency, args.delay, args.timeout)), indent=4))
@@ -0,0 +1,187 @@
+'''
+    `LocalSocks` relay benchmark: connect latency and relay throughput
+    through the local gateway to a stand-in SOCKS5 upstream (auth, echo),
+    compared with connecting to the upstream directly. No network needed.
+
+    Throughput: `--streams` parallel connections each send `--mb` MB in
+    64 KB writes and read the echo back; MB/s counts the payload once.
+
+    Checked: every stream gets back exactly the bytes it sent (CRC32 of
+    its own random chunk, so streams can't be mixed up), every connect
+    round trip echoes its byte, and each connection reaches the upstream
+    once.
+
+    Usage: python -m benchmarks.socks_relay [--connections 200] [--streams 4] [--mb 16]
+'''
+
+
+from argparse import ArgumentParser
+from asyncio import (
+    StreamReader,
+    StreamWriter,
+    gather,
+    get_running_loop,
+    open_connection,
+    run
+)
+from json import dumps
+from random import Random
+from time import perf_counter
+from typing import List, Tuple
+from zlib import crc32
+
+from python_socks.async_.asyncio import Proxy
+
+from benchmarks.socks_stub import EchoServer, StubSocks, free_port
+from local_socks.proxy_server import LocalSocks
+
+
+CHUNK_SIZE: int = 1 << 16
+
+
+def _latency(times: List[float]) -> dict:
+    times = sorted(times)
+
+    return {
+        'p50_ms': times and round(times[len(times) // 2] * 1000, 3),
+        'p95_ms': times and round(times[int(len(times) * 0.95) - 1] * 1000, 3),
+        'max_ms': times and round(times[-1] * 1000, 3)
+    }
+
+
+async def _connect(url: str, echo: EchoServer) -> Tuple[StreamReader, StreamWriter]:
+    sock = await Proxy.from_url(url).connect('127.0.0.1', echo.port, timeout=5)
+
+    return await open_connection(sock=sock)
+
+
+async def connect_latency(url: str, echo: EchoServer, connections: int) -> dict:
+    '''
+        Sequential connects through `url`, one byte round trip each
+    '''
+
+    times = []
+
+    for _ in range(connections):
+        started = perf_counter()
+        reader, writer = await _connect(url, echo)
+        writer.write(b'.')
+        assert await reader.readexactly(1) == b'.', 'Wrong byte echoed'
+        times.append(perf_counter() - started)
+        writer.close()
+
+    return {'connections': connections, **_latency(times)}
+
+
+def _expected_crc(chunk: bytes, size: int) -> int:
+    crc = 0
+
+    for _ in range(size // len(chunk)):
+        crc = crc32(chunk, crc)
+
+    return crc
+
+
+async def _stream(url: str, echo: EchoServer, size: int, chunk: bytes) -> int:
+    '''
+        Send `size` bytes of `chunk` repeated and read the echo back
+
+        Return `int` - CRC32 of the echoed bytes
+    '''
+
+    reader, writer = await _connect(url, echo)
+    crc = 0
+
+    async def send() -> None:
+        for _ in range(size // len(chunk)):
+            writer.write(chunk)
+            await writer.drain()
+
+    async def receive() -> None:
+        nonlocal crc
+        left = size
+
+        while left:
+            if not (data := await reader.read(min(left, 1 << 18))):
+                raise ConnectionError('Relay closed early')
+
+            crc = crc32(data, crc)
+            left -= len(data)
+
+    await gather(send(), receive())
+    writer.close()
+
+    return crc
+
+
+async def throughput(url: str, echo: EchoServer, streams: int, mb: int) -> dict:
+    size = mb * 1024 ** 2
+    chunks = [Random(stream).randbytes(CHUNK_SIZE) for stream in range(streams)]
+    expected = [_expected_crc(chunk, size) for chunk in chunks]
+
+    started = perf_counter()
+    echoed = await gather(*(_stream(url, echo, size, chunk) for chunk in chunks))
+    seconds = perf_counter() - started
+
+    assert list(echoed) == expected, 'Relayed bytes differ from the sent ones'
+
+    return {
+        'streams': streams,
+        'mb': mb * streams,
+        'seconds': round(seconds, 3),
+        'mb_per_second': round(mb * streams / seconds, 1)
+    }
+
+
+async def main(connections: int, streams: int, mb: int) -> dict:
+    echo = EchoServer()
+    await echo.start()
+
+    upstream = StubSocks(auth=('user', 'pass'))
+    await upstream.start()
+
+    port = free_port()
+    gateway = LocalSocks(get_running_loop(), port, upstream.url)
+    await gateway.start_server()
+
+    report = {}
+
+    try:
+        for name, url in (
+            ('direct', upstream.url),
+            ('gateway', f'socks5://127.0.0.1:{port}')
+        ):
+            connects = upstream.connects
+            report[name] = {
+                'connect': await connect_latency(url, echo, connections),
+                'relay': await throughput(url, echo, streams, mb)
+            }
+
+            assert upstream.connects - connects == connections + streams, \
+                f'{name}: {upstream.connects - connects} upstream connects'
+    finally:
+        await gateway.shut_down()
+        await upstream.stop()
+        await echo.stop()
+
+    report['gateway_overhead'] = {
+        'connect_p50_ms': round(
+            report['gateway']['connect']['p50_ms'] - report['direct']['connect']['p50_ms'], 3
+        ),
+        'relay_ratio': round(
+            report['gateway']['relay']['mb_per_second']
+            / report['direct']['relay']['mb_per_second'], 3
+        )
+    }
+
+    return report
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--connections', type=int, default=200)
+    parser.add_argument('--streams', type=int, default=4)
+    parser.add_argument('--mb', type=int, default=16, help='per stream')
+    args = parser.parse_args()
+
+    print(dumps(run(main(args.connections, args.streams, args.mb)), indent=4))
@@ -0,0 +1,181 @@
+'''
+    Local stand-in SOCKS5 upstream and TCP echo server.
+
+    `StubSocks` speaks RFC1928 (+ RFC1929 user/pass auth), can inject
+    handshake delays and failures, and either relays CONNECT to the real
+    destination or answers it locally as an echo server (no network).
+    `free_port()` picks a free local port for servers started by URL.
+'''
+
+
+from asyncio import (
+    CancelledError,
+    IncompleteReadError,
+    Server,
+    StreamReader,
+    StreamWriter,
+    open_connection,
+    gather,
+    sleep,
+    start_server
+)
+from socket import inet_ntop, socket, AF_INET, AF_INET6
+from typing import Optional, Tuple
+
+
+def free_port() -> int:
+    with socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class EchoServer:
+    '''
+        TCP echo server, destination of relay benchmarks
+    '''
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0) -> None:
+        self.host: str = host
+        self.port: int = port
+        self._server: Server = None
+
+    async def _handle(self, reader: StreamReader, writer: StreamWriter) -> None:
+        try:
+            while data := await reader.read(1 << 16):
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self) -> int:
+        self._server = await start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+        return self.port
+
+    async def stop(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+
+class StubSocks:
+    '''
+        Stand-in SOCKS5 upstream
+
+        :param delay: float - seconds to wait before the CONNECT reply
+        :param fail: bool - reply "general failure" to every CONNECT
+        :param echo: bool - echo data instead of dialing the destination
+        :param auth: tuple - required (user, password), `None` for no auth
+    '''
+
+    def __init__(
+        self, delay: float = 0.0, fail: bool = False, echo: bool = True,
+        auth: Optional[Tuple[str, str]] = None, host: str = '127.0.0.1',
+        port: int = 0
+    ) -> None:
+        self.delay: float = delay
+        self.fail: bool = fail
+        self.echo: bool = echo
+        self.auth: Optional[Tuple[str, str]] = auth
+        self.host: str = host
+        self.port: int = port
+
+        self.connects: int = 0
+        self._server: Server = None
+
+    @property
+    def url(self) -> str:
+        credentials = f'{self.auth[0]}:{self.auth[1]}@' if self.auth else ''
+        return f'socks5://{credentials}{self.host}:{self.port}'
+
+    async def _negotiate(self, reader: StreamReader, writer: StreamWriter) -> Tuple[str, int]:
+        _, nmethods = await reader.readexactly(2)
+        methods = await reader.readexactly(nmethods)
+
+        if self.auth:
+            if 2 not in methods:
+                writer.write(b'\x05\xff')
+                raise ConnectionError
+
+            writer.write(b'\x05\x02')
+            _, ulen = await reader.readexactly(2)
+            user = (await reader.readexactly(ulen)).decode()
+            plen = (await reader.readexactly(1))[0]
+            password = (await reader.readexactly(plen)).decode()
+
+            if (user, password) != self.auth:
+                writer.write(b'\x01\x01')
+                raise ConnectionError
+
+            writer.write(b'\x01\x00')
+        else:
+            writer.write(b'\x05\x00')
+
+        _, cmd, _, atyp = await reader.readexactly(4)
+
+        if atyp == 1:
+            host = inet_ntop(AF_INET, await reader.readexactly(4))
+        elif atyp == 4:
+            host = inet_ntop(AF_INET6, await reader.readexactly(16))
+        else:
+            host = (await reader.readexactly((await reader.readexactly(1))[0])).decode()
+
+        port = int.from_bytes(await reader.readexactly(2), 'big')
+
+        return host, port
+
+    def _reply(self, rep: int) -> bytes:
+        return b'\x05' + bytes([rep]) + b'\x00\x01' + bytes(4) + bytes(2)
+
+    async def _pipe(self, reader: StreamReader, writer: StreamWriter) -> None:
+        try:
+            while data := await reader.read(1 << 16):
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _handle(self, reader: StreamReader, writer: StreamWriter) -> None:
+        try:
+            host, port = await self._negotiate(reader, writer)
+            self.connects += 1
+
+            if self.delay:
+                await sleep(self.delay)
+
+            if self.fail:
+                writer.write(self._reply(1))
+                raise ConnectionError
+
+            if self.echo:
+                writer.write(self._reply(0))
+                await self._pipe(reader, writer)
+                return
+
+            remote_reader, remote_writer = await open_connection(host, port)
+            writer.write(self._reply(0))
+
+            await gather(
+                self._pipe(reader, remote_writer), self._pipe(remote_reader, writer)
+            )
+        except (ConnectionError, IncompleteReadError, OSError):
+            pass
+        except CancelledError:
+            # Event loop shut down with the connection still open
+            pass
+        finally:
+            writer.close()
+
+    async def start(self) -> int:
+        self._server = await start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+        return self.port
+
+    async def stop(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
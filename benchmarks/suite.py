@@ -0,0 +1,203 @@
+'''
+    Offline benchmark suite: runs the benchmarks below with fixed sizes
+    and writes one JSON document tagged with the commit, so runs of two
+    commits can be compared. Linux, no browser or network needed.
+
+    - masking: `find_country_specs` and `get_emulations` throughput
+    - socks_relay: `LocalSocks` connect latency and relay throughput
+    - cdp_replay: `ChromeDebugg` attach against the fake DevTools server
+    - cdp_codec: CDP frame decoding per codec backend
+    - bulk_import: streamed profile import / export
+    - web_latency: web interface latency at 10, 1k and 10k profiles,
+      throughput with 1, 2 and 4 web workers
+    - worker_pool: scheduling and stop routing over worker processes
+
+    With `--compare` metrics that got worse by more than `--threshold`
+    percent are listed under "regressions": times (`ms`, `us`, `s`,
+    `seconds` in the name or its parent) lower is better, rates
+    (`per_s*`, `speedup`) higher is better, other numbers are not compared.
+
+    Usage: python -m benchmarks.suite [--only masking,web_latency] [--quick]
+        [--output results.json] [--compare baseline.json] [--threshold 10]
+'''
+
+
+from argparse import ArgumentParser
+from asyncio import run
+from datetime import datetime, timezone
+from json import dumps, loads
+from os import cpu_count, path
+from platform import platform, python_version
+from subprocess import DEVNULL, CalledProcessError, check_output
+from time import perf_counter
+from typing import Callable, Dict, Iterator, Tuple
+
+from benchmarks import (
+    bulk_import,
+    cdp_codec,
+    cdp_replay,
+    masking_throughput,
+    socks_relay,
+    web_latency,
+    worker_pool
+)
+from benchmarks.devtools_server import synthetic_session
+from helpers.persist import atomic_write
+
+
+REPO: str = path.dirname(path.dirname(path.abspath(__file__)))
+
+# {name: callable(quick) -> result}
+SUITE: Dict[str, Callable[[bool], object]] = {
+    'masking': lambda quick: masking_throughput.main(
+        2000 if quick else 20000, 250, 400
+    ),
+    'socks_relay': lambda quick: run(socks_relay.main(
+        50 if quick else 200, 4, 4 if quick else 16
+    )),
+    'cdp_replay': lambda quick: cdp_replay.replay(
+        synthetic_session(5 if quick else 10, 100 if quick else 200)
+    ),
+    'cdp_codec': lambda quick: cdp_codec.run(
+        cdp_codec.synthetic_frames(20000 if quick else 100000)
+    ),
+    'bulk_import': lambda quick: bulk_import.main(
+        2000 if quick else 10000, 250, 400, 200 if quick else 500
+    ),
+    'web_latency': lambda quick: run(web_latency.main(
+        [10, 1000] if quick else [10, 1000, 10000], 10 if quick else 50,
+        [1, 2] if quick else [1, 2, 4], 32, 3 if quick else 5
+    )),
+    'worker_pool': lambda quick: run(worker_pool.main(2 if quick else 3, 4))
+}
+
+
+def _git(*args: str) -> str:
+    try:
+        return check_output(
+            ['git', *args], cwd=REPO, stderr=DEVNULL, text=True
+        ).strip()
+    except (OSError, CalledProcessError):
+        return ''
+
+
+def environment() -> dict:
+    return {
+        'commit': _git('rev-parse', 'HEAD'),
+        'dirty': bool(_git('status', '--porcelain', '--untracked-files=no')),
+        'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': python_version(),
+        'platform': platform(),
+        'cpus': cpu_count()
+    }
+
+
+def metrics(value: object, prefix: str = '') -> Iterator[Tuple[str, float]]:
+    '''
+        Numeric leaves of a result as dotted paths, list items are keyed
+        by their "name" if they have one
+
+        Return `Iterator[tuple]` - (path, value)
+    '''
+
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from metrics(item, f'{prefix}.{key}' if prefix else str(key))
+    elif isinstance(value, list):
+        for i, item in enumerate(value):
+            key = item.get('name', i) if isinstance(item, dict) else i
+            yield from metrics(item, f'{prefix}.{key}')
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield prefix, value
+
+
+def direction(key: str) -> int:
+    '''
+        Return `int` - 1 if higher is better, -1 if lower is better, 0 if
+        the metric is not compared
+    '''
+
+    # Leaf and parent, percentiles are like: "attach_latency_ms.p50"
+    name = '_'.join(key.rsplit('.', 2)[-2:])
+
+    if 'per_s' in name or name.endswith('speedup'):
+        return 1
+
+    if {'ms', 'us', 's', 'seconds'} & set(name.split('_')):
+        return -1
+
+    return 0
+
+
+def compare(baseline: dict, results: dict, threshold: float) -> dict:
+    '''
+        :param baseline: dict - earlier suite output
+        :param results: dict - "results" of this run
+        :param threshold: float - percent change reported
+
+        Return `dict` - {"baseline": commit, "regressions": {...}, "improvements": {...}}
+    '''
+
+    old = dict(metrics(baseline['results']))
+    report = {
+        'baseline': baseline['environment']['commit'],
+        'regressions': {},
+        'improvements': {}
+    }
+
+    for key, new in metrics(results):
+        if not (sign := direction(key)) or not old.get(key, None):
+            continue
+
+        change = (new - old[key]) / old[key] * 100
+
+        if abs(change) >= threshold:
+            report['regressions' if change * sign < 0 else 'improvements'][key] = {
+                'old': old[key], 'new': new, 'change_pct': round(change, 1)
+            }
+
+    return report
+
+
+def main(only: Tuple[str, ...], quick: bool) -> dict:
+    results, timings = {}, {}
+
+    for name in only:
+        started = perf_counter()
+
+        try:
+            results[name] = SUITE[name](quick)
+        except Exception as e:
+            results[name] = {'error': f'{type(e).__name__}: {e}'}
+
+        timings[name] = round(perf_counter() - started, 2)
+
+    return {
+        'environment': environment() | {'quick': quick},
+        'suite_seconds': timings,
+        'results': results
+    }
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--only', default=','.join(SUITE), help='comma separated benchmarks')
+    parser.add_argument('--quick', action='store_true', help='smaller sizes')
+    parser.add_argument('--output', help='also write the JSON here')
+    parser.add_argument('--compare', help='earlier suite output')
+    parser.add_argument('--threshold', type=float, default=10, help='percent')
+    args = parser.parse_args()
+
+    only = tuple(name.strip() for name in args.only.split(','))
+    assert all(name in SUITE for name in only), f'Known benchmarks: {", ".join(SUITE)}'
+
+    report = main(only, args.quick)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            report['compare'] = compare(loads(file.read()), report['results'], args.threshold)
+
+    if args.output:
+        atomic_write(args.output, dumps(report, indent=4))
+
+    print(dumps(report, indent=4))
@@ -0,0 +1,482 @@
+'''
+    Backend of the web interface.
+
+    `Backend` owns everything that must exist once: the launcher (Chrome
+    and proxy subprocesses, or the pool of worker nodes), `MaskingTools`
+    with the geo data, the trash reaper, disk usage index and proxy
+    health checks.
+
+    With one web worker it runs in process. With several, one backend
+    process (`serve()`, managed by Sanic) runs it behind `BackendAgent`,
+    and every web worker uses `BackendClient`, which has the same async
+    methods over HTTP on 127.0.0.1. Profiles are shared through
+    `ProfileStore`.
+
+    Every RPC call carries the token the main process generated for its
+    workers (`TOKEN_HEADER`), so neither other local users nor web pages
+    (a cross-origin POST from a browser on this host) can launch
+    profiles or move directories into the trash.
+'''
+
+
+from asyncio import Task, get_running_loop, run, sleep, to_thread
+from os.path import basename, dirname, realpath
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import ClientSession, ClientTimeout, web
+from aiohttp.client_exceptions import ClientError
+
+from helpers.config import ChromeConfig, ConfigService
+from helpers.events import EventPipeline
+from helpers.launcher import BatchLauncher
+from helpers.masking import MaskingTools
+from helpers.profiles import ProfileStore
+from helpers.proxy_health import ProxyHealth
+from helpers.storage import DiskUsageIndex, ProfileReaper
+from helpers.worker import TOKEN_HEADER, WorkerPool, token_middleware
+from local_socks.upstreams import upstream_urls
+
+
+class Backend:
+    '''
+        Launcher and background services
+
+        :param root: str - app dir
+        :param config: ConfigService - shared `chrome_settings.json`
+        :param profiles: ProfileStore - profiles, read only here
+    '''
+
+    def __init__(self, root: str, config: ConfigService, profiles: ProfileStore) -> None:
+        settings = config.config
+        storage = settings.storage
+
+        self._profiles: ProfileStore = profiles
+        self._profiles_root: str = realpath(f'{root}/profiles')
+        self._usage_interval: float = storage.get('usage_interval', 600)
+        self._tasks: List[Task] = []
+
+        self.masking: MaskingTools = MaskingTools.from_config(settings)
+        self.workers: WorkerPool = WorkerPool(list(settings.workers), settings.worker_token)
+        self.launcher: BatchLauncher = BatchLauncher(
+            self.masking, EventPipeline.from_config(settings.events), config=config
+        )
+        self.reaper: ProfileReaper = ProfileReaper(
+            f'{root}/profiles/.trash', storage.get('delete_rate', 2000)
+        )
+        self.usage_index: DiskUsageIndex = DiskUsageIndex(
+            self.reaper,
+            storage['cache_quota_mb'] * 1024 ** 2
+            if storage.get('cache_quota_mb', None) else None
+        )
+        self.proxy_health: ProxyHealth = ProxyHealth.from_config(settings.proxy_health)
+
+        config.subscribe(self._apply_config)
+
+    def _apply_config(self, config: ChromeConfig) -> None:
+        '''
+            Hot-reload hook. Launch settings are read by every launch,
+            here only long-lived objects are updated.
+        '''
+
+        self.masking.configure(config)
+        self.workers.token = config.worker_token
+
+        for url in config.workers:
+            self.workers.register(url)
+
+    def _proxy_urls(self) -> List[str]:
+        return [
+            url for profile in self._profiles.values()
+            for url in upstream_urls(profile['proxy'])
+        ]
+
+    async def _usage_indexer(self) -> None:
+        '''
+            Rescan disk usage of all profiles every `usage_interval` seconds
+        '''
+
+        while True:
+            await to_thread(
+                self.usage_index.scan,
+                {uuid: profile['path'] for uuid, profile in self._profiles.items()},
+                lambda uuid: uuid in self.launcher.running
+            )
+            await sleep(self._usage_interval)
+
+    def start(self) -> None:
+        '''
+            Start background services in the running loop
+        '''
+
+        self.reaper.start()
+
+        loop = get_running_loop()
+        self._tasks = [
+            loop.create_task(self._usage_indexer(), name='usage_indexer'),
+            loop.create_task(self.proxy_health.run(self._proxy_urls), name='proxy_health')
+        ]
+
+    async def stop(self) -> None:
+        '''
+            Close running browsers and stop background services
+        '''
+
+        await self.launcher.stop_all()
+
+        for task in self._tasks:
+            task.cancel()
+
+        self.reaper.stop()
+
+    def _launcher(self) -> BatchLauncher | WorkerPool:
+        '''
+            Registered workers if any, in-process launcher otherwise
+        '''
+
+        return self.workers or self.launcher
+
+    async def launch(self, uuid: str, profile: dict) -> dict:
+        return await self._launcher().launch(uuid, profile)
+
+    async def launch_batch(self, profiles: Dict[str, dict]) -> List[dict]:
+        return await self._launcher().launch_batch(profiles)
+
+    async def stop_profile(self, uuid: str) -> bool:
+        return await self._launcher().stop(uuid)
+
+    async def running(self) -> List[str]:
+        '''
+            UUIDs of profiles open in this process
+        '''
+
+        return list(self.launcher.running)
+
+    async def targets(self) -> dict:
+        '''
+            Target states of running profiles, per worker if any
+        '''
+
+        if self.workers:
+            return {
+                url: status and status['targets']
+                for url, status in (await self.workers.status()).items()
+            }
+
+        return self.launcher.status()['targets']
+
+    async def metrics(self) -> dict:
+        '''
+            Attach latency histograms, per worker if any
+        '''
+
+        if self.workers:
+            return await self.workers.metrics()
+
+        return self.launcher.metrics.snapshot()
+
+    async def usage(self) -> Dict[str, dict]:
+        return self.usage_index.usage
+
+    async def trash(self, uuid: str) -> bool:
+        '''
+            Move user-data-dir of a profile into trash, call before the
+            profile is removed from `ProfileStore`
+
+            :param uuid: str - profile UUID
+
+            Return `bool` - `False` if the profile is unknown or its
+                user-data-dir is not a profile directory of `{root}/profiles`
+        '''
+
+        if (profile := self._profiles.get(uuid, None)) is None:
+            return False
+
+        path = realpath(profile['path'])
+
+        # Profile dirs are named by UUID, dot dirs are the trash and templates
+        if dirname(path) != self._profiles_root or basename(path).startswith('.'):
+            return False
+
+        await to_thread(self.reaper.trash, path)
+        self.usage_index.usage.pop(uuid, None)
+
+        return True
+
+    async def proxies(self, check: bool = False) -> Dict[str, Optional[dict]]:
+        '''
+            Cached health of all profile proxies
+
+            :param check: bool - probe right away
+
+            Return `dict` - {url: ProbeResult as dict, `None` if not probed}
+        '''
+
+        urls = self._proxy_urls()
+
+        if check:
+            await self.proxy_health.check_all(urls)
+
+        return {
+            url: (result := self.proxy_health.status(url)) and result._asdict()
+            for url in urls
+        }
+
+    async def country_specs(self, points: List[Tuple[float, float]]) -> List[dict]:
+        return await to_thread(self.masking.find_country_specs_batch, points)
+
+    async def register_worker(self, url: str) -> List[str]:
+        self.workers.register(url)
+
+        return self.workers.workers
+
+    async def workers_status(self) -> Dict[str, Optional[dict]]:
+        return await self.workers.status()
+
+
+class BackendAgent:
+    '''
+        HTTP RPC around `Backend`, for the web workers
+
+        :param backend: Backend - backend of this process
+        :param token: str - shared secret, required in `TOKEN_HEADER`
+            of every call
+        :param host: str - listen host
+        :param port: int - listen port
+    '''
+
+    def __init__(
+        self, backend: Backend, token: str, host: str = '127.0.0.1', port: int = 9000
+    ) -> None:
+        self._backend: Backend = backend
+        self._token: str = token
+        self._host: str = host
+        self._port: int = port
+        self._runner: web.AppRunner = None
+
+    async def start(self) -> None:
+        app = web.Application(
+            client_max_size=64 * 1024 ** 2, middlewares=[token_middleware(self._token)]
+        )
+        app.router.add_post('/launch', self._launch)
+        app.router.add_post('/launch_batch', self._launch_batch)
+        app.router.add_post('/stop/{uuid}', self._stop)
+        app.router.add_post('/trash/{uuid}', self._trash)
+        app.router.add_post('/geo', self._geo)
+        app.router.add_get('/proxies', self._proxies)
+        app.router.add_post('/workers', self._register)
+        app.router.add_get('/workers', self._call('workers_status'))
+
+        for name in ('running', 'targets', 'metrics', 'usage'):
+            app.router.add_get(f'/{name}', self._call(name))
+
+        self._runner = web.AppRunner(app, handle_signals=False)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self._host, self._port).start()
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def _call(self, name: str):
+        async def handler(request: web.Request) -> web.Response:
+            return web.json_response(await getattr(self._backend, name)())
+
+        return handler
+
+    async def _launch(self, request: web.Request) -> web.Response:
+        '''
+            Body: {"uuid": "...", "profile": {...}}
+        '''
+
+        body = await request.json()
+
+        return web.json_response(await self._backend.launch(body['uuid'], body['profile']))
+
+    async def _launch_batch(self, request: web.Request) -> web.Response:
+        '''
+            Body: {"profiles": {uuid: profile}}
+        '''
+
+        body = await request.json()
+
+        return web.json_response(await self._backend.launch_batch(body['profiles']))
+
+    async def _stop(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            await self._backend.stop_profile(request.match_info['uuid'])
+        )
+
+    async def _trash(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            await self._backend.trash(request.match_info['uuid'])
+        )
+
+    async def _geo(self, request: web.Request) -> web.Response:
+        '''
+            Body: {"points": [[lat, lon], ...]}
+        '''
+
+        body = await request.json()
+
+        return web.json_response(await self._backend.country_specs(
+            [(lat, lon) for lat, lon in body['points']]
+        ))
+
+    async def _proxies(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            await self._backend.proxies(bool(request.query.get('check', None)))
+        )
+
+    async def _register(self, request: web.Request) -> web.Response:
+        '''
+            Body: {"url": "http://host:9001"}
+        '''
+
+        body = await request.json()
+
+        return web.json_response(await self._backend.register_worker(body['url']))
+
+
+class BackendClient:
+    '''
+        `Backend` of another process, same async methods
+
+        :param url: str - backend URL, like: "http://127.0.0.1:9000"
+        :param token: str - shared secret of `BackendAgent`
+        :param timeout: float - connect timeout, calls like launches can
+            take longer and are not limited
+        :param cache_ttl: float - seconds disk usage and proxy health are
+            reused, so list pages do not queue on the backend
+    '''
+
+    def __init__(
+        self, url: str, token: str, timeout: float = 5, cache_ttl: float = 1
+    ) -> None:
+        self._url: str = url.rstrip('/')
+        self._token: str = token
+        self._timeout: float = timeout
+        self._cache_ttl: float = cache_ttl
+        self._cache: Dict[str, Tuple[float, object]] = {}
+        self._session: ClientSession = None
+
+    async def _call(self, method: str, path: str, **kwargs) -> object:
+        # One pooled session per web worker, created in its loop
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(
+                headers={TOKEN_HEADER: self._token},
+                timeout=ClientTimeout(total=None, connect=self._timeout)
+            )
+
+        async with self._session.request(method, f'{self._url}{path}', **kwargs) as resp:
+            resp.raise_for_status()
+            return await resp.json()
+
+    async def _cached(self, path: str) -> object:
+        now = get_running_loop().time()
+
+        if (cached := self._cache.get(path, None)) and cached[0] > now:
+            return cached[1]
+
+        result = await self._call('GET', path)
+        self._cache[path] = (now + self._cache_ttl, result)
+
+        return result
+
+    async def wait_ready(self, timeout: float = 120) -> None:
+        '''
+            Wait till the backend process answers, it loads the geo data
+            on start
+        '''
+
+        loop = get_running_loop()
+        deadline = loop.time() + timeout
+
+        while True:
+            try:
+                await self._call('GET', '/running')
+                return
+            except (ClientError, OSError):
+                if loop.time() > deadline:
+                    raise
+
+            await sleep(0.2)
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+    async def launch(self, uuid: str, profile: dict) -> dict:
+        return await self._call('POST', '/launch', json={'uuid': uuid, 'profile': profile})
+
+    async def launch_batch(self, profiles: Dict[str, dict]) -> List[dict]:
+        return await self._call('POST', '/launch_batch', json={'profiles': profiles})
+
+    async def stop_profile(self, uuid: str) -> bool:
+        return await self._call('POST', f'/stop/{uuid}')
+
+    async def running(self) -> List[str]:
+        return await self._call('GET', '/running')
+
+    async def targets(self) -> dict:
+        return await self._call('GET', '/targets')
+
+    async def metrics(self) -> dict:
+        return await self._call('GET', '/metrics')
+
+    async def usage(self) -> Dict[str, dict]:
+        return await self._cached('/usage')
+
+    async def trash(self, uuid: str) -> bool:
+        return await self._call('POST', f'/trash/{uuid}')
+
+    async def proxies(self, check: bool = False) -> Dict[str, Optional[dict]]:
+        if check:
+            return await self._call('GET', '/proxies', params={'check': '1'})
+
+        return await self._cached('/proxies')
+
+    async def country_specs(self, points: List[Tuple[float, float]]) -> List[dict]:
+        return await self._call('POST', '/geo', json={'points': points})
+
+    async def register_worker(self, url: str) -> List[str]:
+        return await self._call('POST', '/workers', json={'url': url})
+
+    async def workers_status(self) -> Dict[str, Optional[dict]]:
+        return await self._call('GET', '/workers')
+
+
+async def _serve(root: str, token: str, host: str, port: int) -> None:
+    config = ConfigService(f'{root}/chrome_settings.json')
+    config.start()
+
+    profiles = ProfileStore(f'{root}/profiles.json')
+    backend = Backend(root, config, profiles)
+    agent = BackendAgent(backend, token, host, port)
+
+    await agent.start()
+    backend.start()
+
+    try:
+        while True:
+            await sleep(3600)
+    finally:
+        await agent.stop()
+        await backend.stop()
+        config.stop()
+
+
+def serve(root: str, token: str, host: str = '127.0.0.1', port: int = 9000) -> None:
+    '''
+        Backend process, started by `web-interface.py --workers N`.
+        Stopped with SIGINT.
+
+        :param root: str - app dir
+        :param token: str - shared secret of the RPC
+        :param host: str - RPC listen host
+        :param port: int - RPC listen port
+    '''
+
+    try:
+        run(_serve(root, token, host, port))
+    except KeyboardInterrupt:
+        pass
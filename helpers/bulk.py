@@ -0,0 +1,386 @@
+'''
+    Bulk profile import and export.
+
+    Import reads a streamed NDJSON or CSV body chunk by chunk. Rows are
+    validated as they arrive and geo-resolved in batches (one
+    `MaskingTools.find_country_specs_batch` call per batch, in process or
+    in the backend). Profiles are only handed out once the whole body is
+    read, so the caller commits them at once: one update of the profile
+    store and one write of `profiles.json`.
+
+    Row fields: name, proxy, lat, lon, cpu, ram, desc, launch_args.
+    CSV needs a header line, quoted fields must not contain newlines.
+
+    CLI:
+        python -m helpers.bulk import profiles.csv [--url http://127.0.0.1:8080]
+        python -m helpers.bulk export --format csv [--output profiles.csv]
+'''
+
+
+from argparse import ArgumentParser
+from asyncio import run, to_thread
+from csv import DictWriter, reader as csv_reader
+from html import unescape as html_unescape
+from io import StringIO
+from json import JSONDecodeError, dumps, loads
+from math import isfinite
+from sys import stdout
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, List, Tuple
+from uuid import uuid4
+
+from aiohttp import ClientSession
+
+from helpers.profiles import new_profile
+from local_socks.upstreams import (
+    format_proxy_field,
+    parse_proxy_field,
+    proxy_error,
+    upstream_urls
+)
+
+
+FORMATS: Dict[str, str] = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+EXPORT_FIELDS: tuple = (
+    'uuid', 'name', 'created', 'proxy', 'lat', 'lon', 'cpu', 'ram',
+    'desc', 'launch_args'
+)
+
+# `find_country_specs_batch`: [(lat, lon), ...] -> [specs, ...]
+CountrySpecs = Callable[[List[Tuple[float, float]]], Awaitable[List[dict]]]
+
+
+def _number(row: dict, key: str, low: float, high: float) -> float:
+    if (value := row.get(key, None)) in (None, ''):
+        raise ValueError(f'{key} is required')
+
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{key} is not a number') from None
+
+    if not isfinite(value) or not low <= value <= high:
+        raise ValueError(f'{key} out of range')
+
+    return value
+
+
+def _count(row: dict, key: str) -> int:
+    try:
+        value = int(row.get(key, None) or 0)
+    except (TypeError, ValueError):
+        raise ValueError(f'{key} is not an integer') from None
+
+    if value < 0:
+        raise ValueError(f'{key} is negative')
+
+    return value
+
+
+def profile_fields(row: dict) -> dict:
+    '''
+        Validate one import row
+
+        :param row: dict - like: {"name": "a", "lat": "25.2", "lon": "55.3"}
+
+        Return `dict` - keyword args of `new_profile`, raises `ValueError`
+    '''
+
+    if not (name := str(row.get('name', None) or '').strip()):
+        raise ValueError('name is required')
+
+    proxy = row.get('proxy', None) or 'direct://'
+
+    try:
+        proxy = parse_proxy_field(proxy) if isinstance(proxy, str) else proxy
+        urls = upstream_urls(proxy)
+    except (AssertionError, KeyError, TypeError, ValueError):
+        raise ValueError('invalid proxy') from None
+
+    # Same check as `ChromeDebugg` on launch
+    if error := proxy_error(urls):
+        raise ValueError(error)
+
+    launch_args = row.get('launch_args', None) or []
+
+    if isinstance(launch_args, str):
+        launch_args = launch_args.split()
+    elif not all(isinstance(arg, str) for arg in launch_args):
+        raise ValueError('launch_args must be strings')
+
+    return {
+        'name': name,
+        'proxy': proxy,
+        'lat': _number(row, 'lat', -90, 90),
+        'lon': _number(row, 'lon', -180, 180),
+        'cpu': _count(row, 'cpu'),
+        'ram': _count(row, 'ram'),
+        'desc': str(row.get('desc', None) or ''),
+        'launch_args': launch_args
+    }
+
+
+class ProfileImport:
+    '''
+        One import transaction, see `run()`. `profiles` holds the new
+        records keyed by UUID.
+
+        :param root: str - app dir, see `new_profile`
+        :param format: str - "ndjson" or "csv"
+        :param batch: int - rows per geo lookup
+        :param max_errors: int - errors kept for the report, all are counted
+    '''
+
+    def __init__(
+        self, root: str, format: str = 'ndjson', batch: int = 1000,
+        max_errors: int = 100
+    ) -> None:
+        assert format in FORMATS, f'Unknown format: {format}'
+
+        self._root: str = root
+        self._format: str = format
+        self._batch: int = batch
+        self._max_errors: int = max_errors
+
+        self._buffer: bytes = b''
+        self._header: List[str] = None
+        self._line: int = 0
+        self._pending: List[Tuple[int, dict]] = []
+
+        self.profiles: Dict[str, dict] = {}
+        self.errors: List[dict] = []
+        self.rows: int = 0
+        self.failed: int = 0
+
+    def _error(self, line: int, error: str) -> None:
+        self.failed += 1
+
+        if len(self.errors) < self._max_errors:
+            self.errors.append({'line': line, 'error': error})
+
+    async def run(
+        self, chunks: AsyncIterator[bytes],
+        country_specs: CountrySpecs
+    ) -> dict:
+        '''
+            Read the body and geo-resolve all rows. Parsing runs in a
+            thread, so the event loop keeps serving other requests.
+
+            :param chunks: async iterator - body chunks, any size
+            :param country_specs: async callable - `find_country_specs_batch`
+
+            Return `dict` - report, like: {"rows": 10, "imported": 9, "failed": 1, "errors": [...]}
+        '''
+
+        async for chunk in chunks:
+            await to_thread(self.feed, chunk)
+
+            if len(self._pending) >= self._batch:
+                await self._resolve(country_specs)
+
+        await to_thread(self.feed, b'', True)
+        await self._resolve(country_specs)
+
+        return {
+            'rows': self.rows,
+            'imported': len(self.profiles),
+            'failed': self.failed,
+            'errors': self.errors
+        }
+
+    def feed(self, chunk: bytes, last: bool = False) -> None:
+        '''
+            :param chunk: bytes - next part of the body
+            :param last: bool - end of body, parse the unterminated line
+        '''
+
+        lines = (self._buffer + chunk).split(b'\n')
+        self._buffer = b'' if last else lines.pop()
+
+        self._parse([line for line in lines if line] if last else lines)
+
+    def _parse(self, lines: List[bytes]) -> None:
+        texts = []
+
+        for raw in lines:
+            self._line += 1
+
+            try:
+                text = raw.decode('utf-8').rstrip('\r').lstrip('\ufeff')
+            except UnicodeDecodeError:
+                self.rows += 1
+                self._error(self._line, 'not UTF-8')
+                continue
+
+            if text.strip():
+                texts.append((self._line, text))
+
+        if self._format == 'csv':
+            rows = self._csv_rows(texts)
+        else:
+            rows = self._ndjson_rows(texts)
+
+        for line, row in rows:
+            self.rows += 1
+
+            try:
+                self._pending.append((line, profile_fields(row)))
+            except ValueError as e:
+                self._error(line, str(e))
+
+    def _ndjson_rows(self, texts: List[Tuple[int, str]]) -> Iterator[Tuple[int, dict]]:
+        for line, text in texts:
+            try:
+                row = loads(text)
+            except JSONDecodeError:
+                row = None
+
+            if isinstance(row, dict):
+                yield line, row
+            else:
+                self.rows += 1
+                self._error(line, 'not a JSON object')
+
+    def _csv_rows(self, texts: List[Tuple[int, str]]) -> Iterator[Tuple[int, dict]]:
+        for (line, _), values in zip(texts, csv_reader(text for _, text in texts)):
+            if self._header is None:
+                self._header = [value.strip().lower() for value in values]
+            elif len(values) != len(self._header):
+                self.rows += 1
+                self._error(line, f'expected {len(self._header)} columns')
+            else:
+                yield line, dict(zip(self._header, values))
+
+    async def _resolve(
+        self, country_specs: CountrySpecs
+    ) -> None:
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, []
+        specs = await country_specs(
+            [(fields['lat'], fields['lon']) for _, fields in batch]
+        )
+
+        for (line, fields), country in zip(batch, specs):
+            if not country:
+                self._error(line, 'no country at lat/lon')
+                continue
+
+            uuid = str(uuid4())
+            self.profiles[uuid] = new_profile(self._root, uuid, **fields)
+
+
+def export_row(uuid: str, profile: dict) -> dict:
+    '''
+        Flat export row of one profile, importable again
+    '''
+
+    return {
+        'uuid': uuid,
+        'name': profile['name'],
+        'created': profile.get('created', ''),
+        'proxy': profile['proxy'],
+        'lat': profile['spoofing']['geo']['lat'],
+        'lon': profile['spoofing']['geo']['lon'],
+        'cpu': profile['spoofing']['hardware'].get('cpu', 0),
+        'ram': profile['spoofing']['hardware'].get('ram', 0),
+        'desc': html_unescape(profile.get('desc', '')),
+        'launch_args': profile.get('launch_args', [])
+    }
+
+
+def iter_export(
+    profiles: Iterable[Tuple[str, dict]], format: str = 'ndjson', batch: int = 500
+) -> Iterator[str]:
+    '''
+        Export body in chunks of `batch` rows
+
+        :param profiles: iterable - (uuid, profile) pairs
+        :param format: str - "ndjson" or "csv"
+
+        Return `Iterator[str]`
+    '''
+
+    assert format in FORMATS, f'Unknown format: {format}'
+
+    buffer = StringIO()
+    writer = DictWriter(buffer, EXPORT_FIELDS, lineterminator='\n')
+
+    if format == 'csv':
+        writer.writeheader()
+
+    for count, (uuid, profile) in enumerate(profiles, 1):
+        row = export_row(uuid, profile)
+
+        if format == 'csv':
+            row['proxy'] = format_proxy_field(row['proxy'])
+            row['launch_args'] = ' '.join(row['launch_args'])
+            writer.writerow(row)
+        else:
+            buffer.write(dumps(row, ensure_ascii=False) + '\n')
+
+        if count % batch == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if data := buffer.getvalue():
+        yield data
+
+
+async def _import(url: str, path: str, format: str, skip_invalid: bool) -> dict:
+    async def chunks():
+        with open(path, 'rb') as file:
+            while chunk := file.read(1 << 16):
+                yield chunk
+
+    async with ClientSession() as session:
+        async with session.post(
+            f'{url}/import', data=chunks(),
+            params={'format': format, **({'skip_invalid': '1'} if skip_invalid else {})},
+            headers={'Content-Type': FORMATS[format]}
+        ) as resp:
+            return loads(await resp.text())
+
+
+async def _export(url: str, format: str, output: str) -> None:
+    async with ClientSession() as session:
+        async with session.get(f'{url}/export', params={'format': format}) as resp:
+            resp.raise_for_status()
+            file = open(output, 'wb') if output else stdout.buffer
+
+            try:
+                async for chunk in resp.content.iter_chunked(1 << 16):
+                    file.write(chunk)
+            finally:
+                if output:
+                    file.close()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Bulk import / export of profiles')
+    parser.add_argument('--url', default='http://127.0.0.1:8080')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    importing = commands.add_parser('import', help='import NDJSON or CSV file')
+    importing.add_argument('path')
+    importing.add_argument('--format', choices=FORMATS, help='default: by file extension')
+    importing.add_argument(
+        '--skip-invalid', action='store_true', help='import valid rows if some fail'
+    )
+
+    exporting = commands.add_parser('export', help='export all profiles')
+    exporting.add_argument('--format', choices=FORMATS, default='ndjson')
+    exporting.add_argument('--output', help='default: stdout')
+
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        format = args.format or ('csv' if args.path.endswith('.csv') else 'ndjson')
+        print(dumps(run(_import(args.url, args.path, format, args.skip_invalid)), indent=4))
+    else:
+        run(_export(args.url, args.format, args.output))
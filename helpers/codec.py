@@ -0,0 +1,175 @@
+'''
+    JSON codec for CDP traffic.
+
+    Uses `msgspec` or `orjson` when installed, stdlib `json` otherwise.
+    Typed structs are provided for the events the debugger dispatches on,
+    and `peek_method` reads the `method` field without a full decode.
+'''
+
+
+from json import dumps as std_dumps, loads as std_loads
+from typing import NamedTuple, Optional
+
+try:
+    from msgspec import Struct
+    from msgspec.json import Decoder as MsgspecDecoder, Encoder as MsgspecEncoder
+except ImportError:
+    Struct = None
+
+try:
+    from orjson import dumps as orjson_dumps, loads as orjson_loads
+except ImportError:
+    orjson_loads = None
+
+
+# Returned by `peek_method` when the frame layout is not recognised
+UNKNOWN: object = object()
+
+TARGET_EVENTS: tuple = ('Target.attachedToTarget', 'Target.targetCreated')
+DETACH_EVENTS: tuple = ('Inspector.detached', 'Inspector.targetCrashed')
+
+_EVENT_PREFIX: str = '{"method":"'
+_REPLY_PREFIX: str = '{"id":'
+_RESULT_KEY: str = '"result":'
+
+
+if Struct is not None:
+    class TargetInfo(Struct):
+        targetId: str
+        type: str = ''
+        url: str = ''
+
+    class TargetParams(Struct):
+        targetInfo: TargetInfo
+        sessionId: str = ''
+        waitingForDebugger: bool = False
+
+    class TargetEvent(Struct):
+        method: str
+        params: TargetParams
+else:
+    class TargetInfo(NamedTuple):
+        targetId: str
+        type: str = ''
+        url: str = ''
+
+    class TargetParams(NamedTuple):
+        targetInfo: TargetInfo
+        sessionId: str = ''
+        waitingForDebugger: bool = False
+
+    class TargetEvent(NamedTuple):
+        method: str
+        params: TargetParams
+
+
+class CDPCodec:
+    '''
+        Pluggable JSON codec for CDP frames
+
+        :param backend: str - "msgspec", "orjson", "json" or `None` for
+            the fastest installed one
+    '''
+
+    def __init__(self, backend: Optional[str] = None) -> None:
+        if backend is None:
+            backend = 'msgspec' if Struct is not None else \
+                'orjson' if orjson_loads is not None else 'json'
+
+        self.backend: str = backend
+
+        match backend:
+            case 'msgspec':
+                assert Struct is not None, '`msgspec` is not installed'
+
+                encoder = MsgspecEncoder()
+                self._loads = MsgspecDecoder().decode
+                self._dumps = lambda obj: encoder.encode(obj).decode('utf-8')
+                self._target_decoder = MsgspecDecoder(TargetEvent).decode
+            case 'orjson':
+                assert orjson_loads is not None, '`orjson` is not installed'
+
+                self._loads = orjson_loads
+                self._dumps = lambda obj: orjson_dumps(obj).decode('utf-8')
+                self._target_decoder = None
+            case _:
+                self.backend = 'json'
+
+                self._loads = std_loads
+                self._dumps = lambda obj: std_dumps(obj, separators=(',', ':'))
+                self._target_decoder = None
+
+    def loads(self, data: str | bytes) -> dict:
+        '''
+            Decode CDP frame
+
+            :param data: str | bytes - raw frame
+
+            Return `dict`
+        '''
+
+        return self._loads(data)
+
+    def dumps(self, obj: dict) -> str:
+        '''
+            Encode CDP command. Returns `str`, Chrome only accepts text frames
+
+            :param obj: dict - command, like: {'id': 1, 'method': ...}
+
+            Return `str`
+        '''
+
+        return self._dumps(obj)
+
+    def peek_method(self, data: str) -> Optional[str] | object:
+        '''
+            Read `method` of CDP frame without decoding it.
+            Chrome always serialises `method` (events) or `id` (replies) first.
+
+            :param data: str - raw frame
+
+            Return `str` for events, `None` for successful command replies,
+            `UNKNOWN` if the frame has to be decoded: error replies (always
+            logged) and unrecognised layouts
+        '''
+
+        if data.startswith(_EVENT_PREFIX):
+            end = data.find('"', len(_EVENT_PREFIX))
+
+            if end > 0:
+                return data[len(_EVENT_PREFIX):end]
+        elif data.startswith(_REPLY_PREFIX):
+            end = data.find(',', len(_REPLY_PREFIX))
+
+            if end > 0 and data.startswith(_RESULT_KEY, end + 1):
+                return None
+
+        return UNKNOWN
+
+    def decode_target_event(self, data: str | bytes) -> TargetEvent:
+        '''
+            Decode `Target.attachedToTarget` / `Target.targetCreated`
+            into typed `TargetEvent`
+
+            :param data: str | bytes - raw frame
+
+            Return `TargetEvent`
+        '''
+
+        if self._target_decoder is not None:
+            return self._target_decoder(data)
+
+        message = self._loads(data)
+        params = message['params']
+        info = params['targetInfo']
+
+        return TargetEvent(
+            message['method'],
+            TargetParams(
+                TargetInfo(
+                    info['targetId'], info.get('type', ''), info.get('url', '')
+                ),
+                params.get('sessionId', ''),
+                params.get('waitingForDebugger', False)
+            )
+        )
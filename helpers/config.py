@@ -0,0 +1,308 @@
+'''
+    `chrome_settings.json` config service.
+
+    The file is loaded and validated once into an immutable `ChromeConfig`,
+    then watched (inotify on Linux, mtime polling elsewhere) and hot-reloaded.
+    Invalid edits are logged to `errors.log` once per version and the last
+    good config is kept.
+'''
+
+
+from ctypes import CDLL, get_errno
+from ctypes.util import find_library
+from dataclasses import dataclass, field
+from json import loads
+from os import close as os_close, read as os_read, stat
+from os.path import abspath, basename, dirname
+from platform import system as os_platform
+from select import select
+from struct import calcsize, unpack_from
+from threading import Event, Lock, Thread
+from types import MappingProxyType
+from typing import Callable, List, Mapping, Optional, Tuple
+
+from helpers.persist import write_error_log
+
+
+IN_MODIFY: int = 0x00000002
+IN_CLOSE_WRITE: int = 0x00000008
+IN_MOVED_TO: int = 0x00000080
+IN_CREATE: int = 0x00000100
+IN_NONBLOCK: int = 0x00000800
+IN_CLOEXEC: int = 0x00080000
+
+_INOTIFY_EVENT: str = 'iIII'
+
+
+def _frozen(value):
+    '''
+        Recursively freeze JSON value: dict -> mappingproxy, list -> tuple
+    '''
+
+    if isinstance(value, dict):
+        return MappingProxyType({key: _frozen(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_frozen(item) for item in value)
+
+    return value
+
+
+def merge_args(defaults: Tuple[str, ...], overrides: List[str]) -> Tuple[str, ...]:
+    '''
+        Merge Chrome switches. An override replaces the default with the
+        same switch name, `!--switch` removes it, other overrides are appended.
+
+        :param defaults: tuple - default args, like: ("--no-first-run", ...)
+        :param overrides: list - profile args, like: ["--lang=de", "!--no-first-run"]
+
+        Return `Tuple[str, ...]`
+    '''
+
+    def name(arg: str) -> str:
+        return arg.split('=', 1)[0]
+
+    removed = {name(arg[1:]) for arg in overrides if arg.startswith('!')}
+    replaced = {name(arg): arg for arg in overrides if not arg.startswith('!')}
+
+    merged = [
+        replaced.pop(name(arg), arg) for arg in defaults
+        if name(arg) not in removed
+    ]
+
+    return tuple(merged + list(replaced.values()))
+
+
+@dataclass(frozen=True)
+class ChromeConfig:
+    '''
+        Validated, immutable `chrome_settings.json`
+    '''
+
+    location: Mapping[str, str]
+    default_args: Tuple[str, ...]
+    recordings: Optional[str] = None
+    workers: Tuple[str, ...] = ()
+    worker_token: Optional[str] = None
+    events: Mapping = field(default_factory=lambda: MappingProxyType({}))
+    storage: Mapping = field(default_factory=lambda: MappingProxyType({}))
+    masking: Mapping = field(default_factory=lambda: MappingProxyType({}))
+    proxy_health: Mapping = field(default_factory=lambda: MappingProxyType({}))
+    targets: Mapping = field(default_factory=lambda: MappingProxyType({}))
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'ChromeConfig':
+        '''
+            Validate parsed `chrome_settings.json`
+
+            :param data: dict - parsed JSON
+
+            Return `ChromeConfig`
+        '''
+
+        assert isinstance(data.get('location', None), dict), \
+            "`location` must be an object: {platform: path}"
+        assert all(isinstance(path, str) for path in data['location'].values()), \
+            "`location` paths must be strings"
+        assert isinstance(data.get('default_args', None), list) and all(
+            isinstance(arg, str) and arg.startswith('--')
+            for arg in data['default_args']
+        ), "`default_args` must be a list of `--switch` strings"
+        assert data.get('recordings', None) is None or \
+            isinstance(data['recordings'], str), "`recordings` must be a path"
+        assert isinstance(data.get('workers', []), list), "`workers` must be a list"
+        assert data.get('worker_token', None) is None or \
+            isinstance(data['worker_token'], str), "`worker_token` must be a string"
+
+        for section in ('events', 'storage', 'masking', 'proxy_health', 'targets'):
+            assert isinstance(data.get(section, {}), dict), \
+                f"`{section}` must be an object"
+
+        return cls(
+            location=_frozen(data['location']),
+            default_args=_frozen(data['default_args']),
+            recordings=data.get('recordings', None),
+            workers=_frozen(data.get('workers', [])),
+            worker_token=data.get('worker_token', None) or None,
+            events=_frozen(data.get('events', {})),
+            storage=_frozen(data.get('storage', {})),
+            masking=_frozen(data.get('masking', {})),
+            proxy_health=_frozen(data.get('proxy_health', {})),
+            targets=_frozen(data.get('targets', {}))
+        )
+
+    def executable(self) -> str:
+        return self.location.get(os_platform(), '')
+
+    def launch_args(self, overrides: Optional[List[str]] = None) -> Tuple[str, ...]:
+        '''
+            Default args merged with per-profile overrides, see `merge_args`
+
+            :param overrides: list - `profile['launch_args']`
+
+            Return `Tuple[str, ...]`
+        '''
+
+        if not overrides:
+            return self.default_args
+
+        return merge_args(self.default_args, overrides)
+
+
+class ConfigService:
+    '''
+        Load `chrome_settings.json` once and hot-reload it on change
+
+        :param path: str - config file
+        :param poll_interval: float - mtime polling interval without inotify
+    '''
+
+    def __init__(
+        self, path: str = 'chrome_settings.json', poll_interval: float = 2.0
+    ) -> None:
+        self._path: str = abspath(path)
+        self._poll_interval: float = poll_interval
+
+        self._lock: Lock = Lock()
+        self._stopped: Event = Event()
+        self._thread: Thread = None
+        self._subscribers: List[Callable[[ChromeConfig], None]] = []
+        self._mtime: float = None
+
+        self.config: ChromeConfig = self._load()
+        self.reloads: int = 0
+        self.errors: int = 0
+
+    def _load(self) -> ChromeConfig:
+        # Taken before validation, so the watchers skip an invalid version
+        # till the file changes again
+        self._mtime = stat(self._path).st_mtime
+
+        with open(self._path, 'r', encoding='utf-8') as file:
+            return ChromeConfig.from_dict(loads(file.read()))
+
+    def subscribe(self, callback: Callable[[ChromeConfig], None]) -> None:
+        '''
+            Call `callback(config)` after every successful reload.
+            Called from the watcher thread.
+        '''
+
+        self._subscribers.append(callback)
+
+    def reload(self) -> bool:
+        '''
+            Re-read config. Keeps the previous config if the file is invalid.
+
+            Return `bool` - `True` if reloaded
+        '''
+
+        with self._lock:
+            try:
+                config = self._load()
+            except (OSError, ValueError, AssertionError) as e:
+                self.errors += 1
+                write_error_log(
+                    'ConfigService.reload',
+                    f'invalid chrome_settings.json, keeping previous: {e}'
+                )
+                return False
+
+            if config == self.config:
+                return False
+
+            self.config = config
+            self.reloads += 1
+
+        for callback in self._subscribers:
+            callback(config)
+
+        return True
+
+    def _watch_inotify(self) -> bool:
+        '''
+            Watch config directory with inotify. Editors often replace the
+            file with rename, so the directory is watched, not the file.
+
+            Return `bool` - `False` if inotify is not available
+        '''
+
+        try:
+            libc = CDLL(find_library('c'), use_errno=True)
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        except (OSError, AttributeError, TypeError):
+            return False
+
+        if fd < 0:
+            return False
+
+        try:
+            if libc.inotify_add_watch(
+                fd, dirname(self._path).encode(),
+                IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY
+            ) < 0:
+                write_error_log(
+                    'ConfigService._watch_inotify',
+                    f'inotify_add_watch failed, errno: {get_errno()}'
+                )
+                return False
+
+            name = basename(self._path).encode()
+            header = calcsize(_INOTIFY_EVENT)
+
+            # Catch changes made before the watch was set up
+            if stat(self._path).st_mtime != self._mtime:
+                self.reload()
+
+            while not self._stopped.is_set():
+                if not select([fd], [], [], 1.0)[0]:
+                    continue
+
+                try:
+                    data = os_read(fd, 64 * 1024)
+                except BlockingIOError:
+                    continue
+
+                changed, offset = False, 0
+
+                while offset + header <= len(data):
+                    _, _, _, length = unpack_from(_INOTIFY_EVENT, data, offset)
+                    event_name = data[offset + header:offset + header + length]
+                    changed |= event_name.rstrip(b'\0') == name
+                    offset += header + length
+
+                if changed:
+                    self.reload()
+        finally:
+            os_close(fd)
+
+        return True
+
+    def _watch_poll(self) -> None:
+        while not self._stopped.wait(self._poll_interval):
+            try:
+                if stat(self._path).st_mtime != self._mtime:
+                    self.reload()
+            except OSError:
+                continue
+
+    def _watch(self) -> None:
+        if os_platform() == 'Linux' and self._watch_inotify():
+            return
+
+        self._watch_poll()
+
+    def start(self) -> None:
+        '''
+            Start watcher thread
+        '''
+
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = Thread(target=self._watch, name='ConfigWatcher', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+        if self._thread is not None:
+            self._thread.join(5)
+            self._thread = None
@@ -0,0 +1,289 @@
+'''
+    CDP event dispatch pipeline.
+
+    Replaces per-message `print()` in the debugger loops with subscribers
+    by CDP method, level-based filtering, sampling and buffered sinks.
+'''
+
+
+from json import dumps
+from struct import pack
+from sys import stdout
+from threading import Lock
+from time import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+DEBUG: int = 10
+INFO: int = 20
+WARNING: int = 30
+ERROR: int = 40
+
+LEVELS: Dict[str, int] = {
+    'DEBUG': DEBUG, 'INFO': INFO, 'WARNING': WARNING, 'ERROR': ERROR
+}
+
+# Method prefix -> level. First match wins, so keep specific prefixes first
+DEFAULT_METHOD_LEVELS: Tuple[Tuple[str, int]] = (
+    ('Inspector.', WARNING),
+    ('Target.', INFO),
+    ('Network.', DEBUG),
+    ('Page.', DEBUG),
+    ('Runtime.', DEBUG),
+)
+
+
+class StdoutSink:
+    '''
+        Human readable sink, same output as the old `print()` calls
+    '''
+
+    def __init__(self, stream=None) -> None:
+        self._stream = stream or stdout
+        self._lock: Lock = Lock()
+
+    def write(self, ts: float, level: int, source: str, message: dict) -> None:
+        with self._lock:
+            self._stream.write(f'[{source}] {message}\n')
+
+    def close(self) -> None:
+        self._stream.flush()
+
+
+class NDJSONSink:
+    '''
+        Newline delimited JSON sink with a large write buffer
+
+        :param path: str - output file
+        :param buffering: int - buffer size in bytes
+    '''
+
+    def __init__(self, path: str, buffering: int = 1 << 16) -> None:
+        self._file = open(path, 'ab', buffering=buffering)
+        self._lock: Lock = Lock()
+
+    def write(self, ts: float, level: int, source: str, message: dict) -> None:
+        line = dumps(
+            {'ts': ts, 'level': level, 'source': source, 'msg': message},
+            separators=(',', ':')
+        ).encode('utf-8') + b'\n'
+
+        with self._lock:
+            self._file.write(line)
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class BinarySink:
+    '''
+        Compact length-prefixed binary sink.
+
+        Record layout (little endian):
+        `ts: f64 | level: u8 | source_len: u16 | msg_len: u32 | source | msg`
+
+        :param path: str - output file
+        :param buffering: int - buffer size in bytes
+    '''
+
+    HEADER: str = '<dBHI'
+
+    def __init__(self, path: str, buffering: int = 1 << 16) -> None:
+        self._file = open(path, 'ab', buffering=buffering)
+        self._lock: Lock = Lock()
+
+    def write(self, ts: float, level: int, source: str, message: dict) -> None:
+        source = source.encode('utf-8')
+        payload = dumps(message, separators=(',', ':')).encode('utf-8')
+
+        with self._lock:
+            self._file.write(
+                pack(self.HEADER, ts, level, len(source), len(payload)) +
+                source + payload
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class EventPipeline:
+    '''
+        Dispatch CDP messages to subscribers and (filtered, sampled) sinks.
+
+        Subscribers always receive the messages they subscribed to.
+        Sinks only receive messages at or above `level`; messages below
+        `WARNING` are additionally sampled: only every n-th message per
+        method is kept, where n = round(1 / sample_rate).
+
+        :param level: int | str - minimal level written to sinks
+        :param sample_rate: float - part of sub-WARNING messages to keep, 0..1
+        :param sinks: list - objects with `write(ts, level, source, message)`
+    '''
+
+    def __init__(
+        self, level: int | str = INFO, sample_rate: float = 1.0,
+        sinks: Optional[List] = None,
+        method_levels: Tuple[Tuple[str, int]] = DEFAULT_METHOD_LEVELS
+    ) -> None:
+        self._level: int = LEVELS.get(level, level) if isinstance(level, str) else level
+        self._every: int = max(1, round(1 / sample_rate)) if sample_rate > 0 else 0
+        self._sinks: List = sinks or []
+        self._method_levels: Tuple[Tuple[str, int]] = method_levels
+
+        self._subscribers: Dict[str, List[Callable]] = {}
+        self._level_cache: Dict[str, int] = {}
+        self._seen: Dict[str, int] = {}
+
+        self.dispatched: int = 0
+        self.written: int = 0
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'EventPipeline':
+        '''
+            Build pipeline from `chrome_settings.json`['events']
+
+            :param config: dict - like: {'level': 'INFO', 'sample_rate': 1.0,
+                'sink': 'stdout' | 'ndjson' | 'binary' | None, 'path': '...'}
+
+            Return `EventPipeline`
+        '''
+
+        match config.get('sink', None):
+            case 'stdout':
+                sinks = [StdoutSink()]
+            case 'ndjson':
+                sinks = [NDJSONSink(config.get('path', 'events.ndjson'))]
+            case 'binary':
+                sinks = [BinarySink(config.get('path', 'events.bin'))]
+            case _:
+                sinks = []
+
+        return cls(
+            config.get('level', INFO), config.get('sample_rate', 1.0), sinks
+        )
+
+    def subscribe(self, method: str, callback: Callable) -> None:
+        '''
+            Subscribe `callback(message, source)` to CDP method.
+
+            :param method: str - exact method, like: "Network.requestWillBeSent",
+                domain wildcard, like: "Network.*", or "*" for everything
+            :param callback: Callable - sync function, must be cheap
+        '''
+
+        self._subscribers.setdefault(method, []).append(callback)
+
+    def unsubscribe(self, method: str, callback: Callable) -> None:
+        try:
+            self._subscribers[method].remove(callback)
+        except (KeyError, ValueError):
+            pass
+
+    def level_of(self, method: Optional[str]) -> int:
+        '''
+            Resolve level of CDP method (cached)
+
+            :param method: str | None - CDP method, `None` for command replies
+
+            Return `int`
+        '''
+
+        if method is None:
+            return DEBUG
+
+        if (level := self._level_cache.get(method, None)) is not None:
+            return level
+
+        level = INFO
+
+        for prefix, prefix_level in self._method_levels:
+            if method.startswith(prefix):
+                level = prefix_level
+                break
+
+        self._level_cache[method] = level
+
+        return level
+
+    def wants(self, method: Optional[str]) -> bool:
+        '''
+            Check if message with `method` has any consumer.
+            Lets the caller skip decoding messages nobody will read.
+
+            :param method: str | None - CDP method
+
+            Return `bool`
+        '''
+
+        if self._subscribers and (
+            '*' in self._subscribers or method in self._subscribers or (
+                method and f'{method.split(".", 1)[0]}.*' in self._subscribers
+            )
+        ):
+            return True
+
+        return bool(self._sinks) and self.level_of(method) >= self._level
+
+    def _callbacks(self, method: Optional[str]) -> List[Callable]:
+        callbacks = []
+
+        if method:
+            callbacks += self._subscribers.get(method, [])
+            callbacks += self._subscribers.get(
+                f'{method.split(".", 1)[0]}.*', []
+            )
+
+        return callbacks + self._subscribers.get('*', [])
+
+    def dispatch(self, message: dict, source: str = 'browser') -> None:
+        '''
+            Dispatch decoded CDP message
+
+            :param message: dict - decoded CDP message
+            :param source: str - "browser" or TabID, like: "28910AAK39K"
+
+            Return `None`
+        '''
+
+        self.dispatched += 1
+        method = message.get('method', None)
+
+        if self._subscribers:
+            for callback in self._callbacks(method):
+                callback(message, source)
+
+        if not self._sinks:
+            return
+
+        level = ERROR if 'error' in message else self.level_of(method)
+
+        if level < self._level:
+            return
+
+        if level < WARNING:
+            if not self._every:
+                return
+
+            seen = self._seen.get(method, 0)
+            self._seen[method] = seen + 1
+
+            if seen % self._every:
+                return
+
+        ts = time()
+        self.written += 1
+
+        for sink in self._sinks:
+            sink.write(ts, level, source, message)
+
+    def close(self) -> None:
+        '''
+            Flush and close all sinks
+        '''
+
+        for sink in self._sinks:
+            sink.close()
+
+        self._sinks = []
@@ -0,0 +1,88 @@
+'''
+    Emulation injection plan of one profile.
+
+    `MaskingTools.get_emulations` returns protocol overrides
+    (`Emulation.*`) and script overrides (`Runtime.evaluate`). Script
+    overrides are combined into one source, compiled once per profile
+    and injected per target type before the target is resumed:
+
+    - page, iframe: `Page.addScriptToEvaluateOnNewDocument` with
+      `runImmediately`, so the script also runs in every document the
+      target navigates to later, before page scripts
+    - workers: one `Runtime.evaluate`; a paused worker has not run its
+      own script yet and has no `Page` domain (`Page.enable` is skipped)
+'''
+
+
+from functools import lru_cache
+from typing import List, Tuple
+
+
+# Targets with a `Page` domain
+PAGE_TYPES: frozenset = frozenset((
+    'page', 'iframe', 'background_page', 'webview', ''
+))
+
+
+@lru_cache(maxsize=1024)
+def combine_scripts(sources: Tuple[str, ...]) -> str:
+    '''
+        One script of all overrides, a failing override does not stop
+        the others. Cached, profiles share identical overrides.
+
+        :param sources: tuple - JS sources
+
+        Return `str`
+    '''
+
+    return '(() => {\n' + ''.join(
+        f'try {{\n{source}\n}} catch (e) {{}}\n' for source in sources
+    ) + '})();'
+
+
+class InjectionPlan:
+    '''
+        Commands sent to a new target before `Runtime.runIfWaitingForDebugger`
+
+        :param emulations: list - `MaskingTools.get_emulations()` result
+    '''
+
+    def __init__(self, emulations: List[dict]) -> None:
+        self.protocol: List[dict] = [
+            emulation for emulation in emulations
+            if emulation['method'] != 'Runtime.evaluate'
+        ]
+        self.source: str = combine_scripts(tuple(
+            emulation['params']['expression'] for emulation in emulations
+            if emulation['method'] == 'Runtime.evaluate'
+        )) if len(self.protocol) < len(emulations) else ''
+
+        self._page: List[dict] = [
+            {'method': 'Runtime.enable', 'params': {}},
+            {'method': 'Page.enable', 'params': {}},
+            *self.protocol
+        ]
+        self._worker: List[dict] = [
+            {'method': 'Runtime.enable', 'params': {}},
+            *self.protocol
+        ]
+
+        if self.source:
+            self._page.append({
+                'method': 'Page.addScriptToEvaluateOnNewDocument',
+                'params': {'source': self.source, 'runImmediately': True}
+            })
+            self._worker.append({
+                'method': 'Runtime.evaluate',
+                'params': {'expression': self.source}
+            })
+
+    def commands(self, target_type: str) -> List[dict]:
+        '''
+            :param target_type: str - like: "page", "service_worker"
+
+            Return `List[dict]` - commands, in order
+        '''
+
+        return self._page if target_type in PAGE_TYPES else self._worker
+
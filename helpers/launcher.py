@@ -0,0 +1,403 @@
+'''
+    Concurrent multi-profile launcher with admission control.
+
+    Starts `ChromeDebugg` instances with bounded concurrency, staggers
+    Chrome/proxy spawns and caps live browsers by available cores and RAM.
+
+    CLI: python -m helpers.launcher <uuid> [<uuid> ...] [--concurrency 4]
+'''
+
+
+from argparse import ArgumentParser
+from asyncio import (
+    FIRST_COMPLETED,
+    AbstractEventLoop,
+    Condition,
+    Lock,
+    Semaphore,
+    TimeoutError as AsyncTimeoutError,
+    gather,
+    get_running_loop,
+    new_event_loop,
+    run,
+    run_coroutine_threadsafe,
+    sleep,
+    to_thread,
+    wait,
+    wait_for,
+    wrap_future
+)
+from concurrent.futures import Future
+from json import dumps, loads
+from os import cpu_count, sysconf
+from threading import Thread
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from chromedebugg import ChromeDebugg
+from helpers.config import ConfigService
+from helpers.events import EventPipeline
+from helpers.masking import MaskingTools
+from helpers.metrics import AttachMetrics
+from helpers.persist import write_error_log
+
+
+class BatchLauncher:
+    '''
+        Launch profiles with admission control
+
+        :param masking: MaskingTools - shared masking tools
+        :param events: EventPipeline - shared event pipeline
+        :param concurrency: int - max profiles starting at the same time
+        :param stagger: float - min seconds between two Chrome/proxy spawns
+        :param max_live: int - max live browsers, `None` for `capacity()`
+            checked again on every admission
+        :param online_timeout: float - max seconds to wait for CDP socket
+        :param config: ConfigService - shared `chrome_settings.json`
+        :param debugg: callable - `ChromeDebugg` factory, same signature
+        :param metrics: AttachMetrics - shared attach latency histograms
+    '''
+
+    def __init__(
+        self, masking, events: EventPipeline = None, concurrency: int = 4,
+        stagger: float = 0.5, max_live: int = None, online_timeout: float = 60,
+        config: ConfigService = None,
+        debugg: Callable[..., ChromeDebugg] = ChromeDebugg,
+        metrics: AttachMetrics = None
+    ) -> None:
+        self._masking = masking
+        self._events: EventPipeline = events
+        self._config: ConfigService = config
+        self._debugg: Callable[..., ChromeDebugg] = debugg
+        self.metrics: AttachMetrics = metrics or AttachMetrics()
+
+        self._stagger: float = stagger
+        self._online_timeout: float = online_timeout
+        self._max_live: Optional[int] = max_live
+
+        self._starting: Semaphore = Semaphore(concurrency)
+        self._slots: Condition = Condition()
+        # Live slots taken, from admission till `ChromeDebugg.main()` ends
+        self._admitted: int = 0
+        self._stagger_lock: Lock = Lock()
+        self._last_spawn: float = 0.0
+
+        # UUIDs between `launch()` call and `running` entry
+        self._reserved: Set[str] = set()
+        self.running: Dict[
+            str, Tuple[ChromeDebugg, AbstractEventLoop, Future]
+        ] = {}
+
+    @staticmethod
+    def available_ram() -> Optional[int]:
+        '''
+            `MemAvailable` of `/proc/meminfo` (free RAM plus reclaimable
+            page cache), free pages where there is no `/proc`
+
+            Return `int` - bytes, `None` if unknown
+        '''
+
+        try:
+            with open('/proc/meminfo', 'r', encoding='utf-8') as file:
+                for line in file:
+                    if line.startswith('MemAvailable:'):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError, IndexError):
+            pass
+
+        try:
+            return sysconf('SC_AVPHYS_PAGES') * sysconf('SC_PAGE_SIZE')
+        except (ValueError, OSError, AttributeError):
+            return None
+
+    @classmethod
+    def capacity(
+        cls, running: int = 0, cores_per_browser: float = 0.5,
+        ram_per_browser: int = 400 * 1024 ** 2
+    ) -> int:
+        '''
+            Global cap of live browsers from available cores and RAM
+
+            :param running: int - browsers already running, their RAM is
+                not available anymore
+            :param cores_per_browser: float - CPU cores reserved per browser
+            :param ram_per_browser: int - RAM bytes reserved per browser
+
+            Return `int`
+        '''
+
+        by_cpu = int((cpu_count() or 1) / cores_per_browser)
+
+        if (ram := cls.available_ram()) is None:
+            return max(1, by_cpu)
+
+        return max(1, min(by_cpu, running + ram // ram_per_browser))
+
+    @property
+    def max_live(self) -> int:
+        return self._max_live or self.capacity(self._admitted)
+
+    @property
+    def live(self) -> int:
+        return len(self.running)
+
+    async def _acquire_slot(self) -> None:
+        async with self._slots:
+            while self._admitted >= self.max_live:
+                try:
+                    # RAM can free up without a browser closing
+                    await wait_for(self._slots.wait(), 1)
+                except AsyncTimeoutError:
+                    pass
+
+            self._admitted += 1
+
+    async def _release_slot(self) -> None:
+        async with self._slots:
+            self._admitted -= 1
+            self._slots.notify()
+
+    def _background_loop(self, name: str) -> AbstractEventLoop:
+        '''
+            Create new asyncio event loop and run it "forever" in Thread.
+            The loop is closed once stopped.
+
+            :param name: str - thread name
+
+            Return `AbstractEventLoop`
+        '''
+
+        def run_loop() -> None:
+            try:
+                loop.run_forever()
+            finally:
+                loop.close()
+
+        loop = new_event_loop()
+        Thread(target=run_loop, name=name).start()
+
+        return loop
+
+    async def _wait_stagger(self) -> None:
+        async with self._stagger_lock:
+            if (delay := self._last_spawn + self._stagger - perf_counter()) > 0:
+                await sleep(delay)
+
+            self._last_spawn = perf_counter()
+
+    def _released(
+        self, uuid: str, entry: tuple, loop: AbstractEventLoop
+    ) -> None:
+        '''
+            `ChromeDebugg.main()` finished: stop its loop and free the slot.
+            Called from the profile thread.
+
+            :param entry: tuple - its `running` entry, a newer launch of
+                the same UUID is kept
+        '''
+
+        if self.running.get(uuid, None) is entry:
+            self.running.pop(uuid, None)
+
+        profile_loop = entry[1]
+        profile_loop.call_soon_threadsafe(profile_loop.stop)
+        run_coroutine_threadsafe(self._release_slot(), loop)
+
+    async def launch(self, uuid: str, profile: dict) -> dict:
+        '''
+            Launch single profile and wait till its CDP socket is online
+
+            :param uuid: str - profile UUID
+            :param profile: dict - profile from `profiles.json`
+
+            Return `dict` - launch timings in seconds, like:
+            {'uuid': ..., 'status': 'online', 'queued': 0.1, 'proxy': 0.2, ...}
+        '''
+
+        if uuid in self.running or uuid in self._reserved:
+            return {'uuid': uuid, 'status': 'running'}
+
+        # Reserved before the first `await`: one Chrome per user-data-dir
+        self._reserved.add(uuid)
+        queued = perf_counter()
+
+        try:
+            async with self._starting:
+                await self._acquire_slot()
+                await self._wait_stagger()
+
+                admitted = perf_counter()
+
+                try:
+                    debugg = self._debugg(
+                        profile, self._masking, self._events, config=self._config,
+                        metrics=self.metrics
+                    )
+                except Exception as e:
+                    await self._release_slot()
+                    return {'uuid': uuid, 'status': 'failed', 'error': str(e)}
+
+                profile_loop = self._background_loop(f'ChromeProfile_{uuid}')
+                future = run_coroutine_threadsafe(debugg.main(), profile_loop)
+                entry = (debugg, profile_loop, future)
+                self.running[uuid] = entry
+                self._reserved.discard(uuid)
+
+                loop = get_running_loop()
+                future.add_done_callback(
+                    lambda _: self._released(uuid, entry, loop)
+                )
+
+                online = await to_thread(debugg.online.wait, self._online_timeout)
+
+                if not online:
+                    # Chrome stays down: shut it down, `_released` frees the slot
+                    await self._close(entry)
+        finally:
+            self._reserved.discard(uuid)
+
+        timings = debugg.timings
+        result = {
+            'uuid': uuid,
+            'status': 'online' if 'online' in timings else
+                      'timeout' if not online else 'failed',
+            'queued': round(admitted - queued, 4)
+        }
+
+        previous = timings.get('start', admitted)
+
+        for stage in ('proxy', 'spawn', 'online'):
+            if stage in timings:
+                result[stage] = round(timings[stage] - previous, 4)
+                previous = timings[stage]
+
+        result['total'] = round(previous - queued, 4)
+
+        return result
+
+    async def launch_batch(self, profiles: Dict[str, dict]) -> List[dict]:
+        '''
+            Launch many profiles with bounded concurrency
+
+            :param profiles: dict - {uuid: profile}
+
+            Return `List[dict]` - launch timings per profile, see `launch`
+        '''
+
+        return list(await gather(*(
+            self.launch(uuid, profile) for uuid, profile in profiles.items()
+        )))
+
+    async def stop(self, uuid: str) -> bool:
+        '''
+            Close browser of running profile
+
+            :param uuid: str - profile UUID
+
+            Return `bool` - `False` if profile is not running
+        '''
+
+        if not (running := self.running.get(uuid, None)):
+            return False
+
+        await self._close(running)
+
+        return True
+
+    async def _close(self, entry: tuple) -> None:
+        '''
+            Close browser of a `running` entry. Not online yet, `close()`
+            cancels `main()` in its own loop, so Chrome and the local proxy
+            are shut down before the loop stops.
+        '''
+
+        debugg, profile_loop, future = entry
+
+        try:
+            closing = wrap_future(
+                run_coroutine_threadsafe(debugg.close(), profile_loop)
+            )
+        except RuntimeError:
+            # Loop already closed, `main()` has finished
+            return
+
+        # `main()` may finish and stop the loop before `close()` runs
+        await wait((closing, wrap_future(future)), return_when=FIRST_COMPLETED)
+
+        if closing.done():
+            closing.result()
+
+    async def stop_all(self) -> None:
+        '''
+            Close all running browsers, on shutdown. A failing stop is
+            logged, the other browsers are still closed.
+        '''
+
+        for uuid in list(self.running):
+            try:
+                await self.stop(uuid)
+            except Exception as e:
+                write_error_log('BatchLauncher.stop_all', e)
+
+    def status(self) -> dict:
+        '''
+            Load of this launcher
+
+            Return `dict`, like: {'live': 2, 'max_live': 16, 'load': 0.125, ...}
+        '''
+
+        return {
+            'live': self.live,
+            'max_live': self.max_live,
+            'load': round(self.live / self.max_live, 4),
+            'running': list(self.running),
+            'targets': {
+                uuid: debugg.targets.status()
+                for uuid, (debugg, *_) in list(self.running.items())
+            }
+        }
+
+    async def wait_closed(self) -> None:
+        '''
+            Wait till all launched browsers are closed
+        '''
+
+        await gather(
+            *(wrap_future(future) for *_, future in list(self.running.values())),
+            return_exceptions=True
+        )
+
+
+async def _cli(args) -> None:
+    with open(args.profiles, 'r', encoding='utf-8') as file:
+        profiles = loads(file.read())
+
+    config = ConfigService()
+    config.start()
+
+    unknown = [uuid for uuid in args.uuids if uuid not in profiles]
+    assert not unknown, f"Unknown profiles: {', '.join(unknown)}"
+
+    launcher = BatchLauncher(
+        MaskingTools.from_config(config.config),
+        EventPipeline.from_config(config.config.events),
+        args.concurrency, args.stagger, args.max_live, config=config
+    )
+
+    print(dumps(await launcher.launch_batch(
+        {uuid: profiles[uuid] for uuid in args.uuids}
+    ), indent=4))
+
+    await launcher.wait_closed()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Launch many profiles at once')
+    parser.add_argument('uuids', nargs='+', help='profile UUIDs')
+    parser.add_argument('--profiles', default='profiles.json')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--stagger', type=float, default=0.5)
+    parser.add_argument('--max-live', type=int, default=None)
+    args = parser.parse_args()
+
+    run(_cli(args))
@@ -1,7 +1,8 @@
 from json import loads
-from typing import List
+from typing import List, Tuple
 from random import randint
-from shapely.geometry import shape, Point
+from shapely import STRtree, points as geo_points
+from shapely.geometry import shape
 from timezonefinder import TimezoneFinder
 
 from aiohttp import ClientSession, ClientTimeout
@@ -30,10 +31,42 @@ class MaskingTools:
         for item, value in self._geo_loopup.items():
             value['shape'] = shape(value['shape'])
 
+        # Bounding box index over all country shapes, in file order
+        self._countries: List[dict] = list(self._geo_loopup.values())
+        self._geo_index: STRtree = STRtree(
+            [value['shape'] for value in self._countries]
+        )
+
         self._proxy_timeout: int = proxy_timeout
         self._spoffing: SpoofingTemplates = SpoofingTemplates()
         self._tz_finder: TimezoneFinder = TimezoneFinder()
 
+    @classmethod
+    def from_config(cls, config) -> 'MaskingTools':
+        '''
+            Create from `ChromeConfig.masking`, like:
+            {'proxy_timeout': 30, 'geo_file': 'helpers/WORLD.geojson'}
+
+            config: ChromeConfig - validated `chrome_settings.json`
+
+            Return `MaskingTools`
+        '''
+
+        return cls(
+            config.masking.get('proxy_timeout', 30),
+            config.masking.get('geo_file', 'helpers/WORLD.geojson')
+        )
+
+    def configure(self, config) -> None:
+        '''
+            Apply hot-reloadable settings of `ChromeConfig.masking`.
+            `geo_file` is only read on start.
+
+            config: ChromeConfig - validated `chrome_settings.json`
+        '''
+
+        self._proxy_timeout = config.masking.get('proxy_timeout', 30)
+
     def find_country_specs(self, lat: float, lon: float) -> dict:
         '''
             Find country `locale` and `accept-lang` specs by GeoPoint.
@@ -48,16 +81,39 @@ class MaskingTools:
             }
         '''
 
-        geo_point = Point(lon, lat)
+        return self.find_country_specs_batch([(lat, lon)])[0]
 
-        for item, value in self._geo_loopup.items():
-            if value['shape'].contains(geo_point):
-                return {
-                    'locale': value['locale'],
-                    'accept-lang': value['accept-lang']
-                }
+    def find_country_specs_batch(
+        self, points: List[Tuple[float, float]]
+    ) -> List[dict]:
+        '''
+            `find_country_specs` for many GeoPoints in one index query.
+
+            points: list - (lat, lon) pairs
+
+            Return `List[dict]` in order of `points`, `{}` if no country found
+        '''
+
+        if not points:
+            return []
+
+        found, countries = self._geo_index.query(
+            geo_points([(lon, lat) for lat, lon in points]), predicate='within'
+        )
+        matches = {}
+
+        for point, country in zip(found.tolist(), countries.tolist()):
+            # First country in file order wins, like a linear scan
+            if country < matches.get(point, len(self._countries)):
+                matches[point] = country
 
-        return {}
+        return [
+            {
+                'locale': self._countries[matches[i]]['locale'],
+                'accept-lang': self._countries[matches[i]]['accept-lang']
+            } if i in matches else {}
+            for i in range(len(points))
+        ]
 
     def get_emulations(self, spoofing: dict) -> List[dict]:
         '''
@@ -0,0 +1,179 @@
+'''
+    Attach latency metrics.
+
+    A new target is paused by Chrome (`waitForDebuggerOnStart`) until the
+    debugger sends `Runtime.runIfWaitingForDebugger`. `AttachMetrics`
+    records how long each stage of that pause takes, measured from the
+    target event on the browser socket, as histograms per target type:
+
+    - connected: target socket connected
+    - emulated: `*.enable` and emulations sent
+    - resumed: `Runtime.runIfWaitingForDebugger` sent
+    - acked: all commands sent before resume acknowledged
+
+    CLI: python -m helpers.metrics [--url http://127.0.0.1:8080/metrics/attach]
+'''
+
+
+from argparse import ArgumentParser
+from asyncio import run
+from bisect import bisect_left
+from json import dumps, loads
+from threading import Lock
+from typing import Dict, List, Optional
+
+from aiohttp import ClientSession
+
+
+STAGES: tuple = ('connected', 'emulated', 'resumed', 'acked')
+
+# Upper bounds of histogram buckets in ms, last bucket is "more"
+BUCKETS_MS: tuple = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class Histogram:
+    '''
+        Fixed bucket latency histogram
+    '''
+
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self) -> None:
+        self.counts: List[int] = [0] * (len(BUCKETS_MS) + 1)
+        self.count: int = 0
+        self.total: float = 0.0
+        self.max: float = 0.0
+
+    def observe(self, ms: float) -> None:
+        self.counts[bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def quantile(self, q: float) -> Optional[float]:
+        '''
+            Upper bound of the bucket holding quantile `q`, capped by max
+
+            Return `float` - ms, `None` if empty
+        '''
+
+        if not self.count:
+            return None
+
+        rank, seen = q * self.count, 0
+
+        for bound, count in zip(BUCKETS_MS, self.counts):
+            seen += count
+
+            if seen >= rank:
+                return round(min(bound, self.max), 3)
+
+        return round(self.max, 3)
+
+    def as_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total / self.count, 3) if self.count else None,
+            'p50_ms': self.quantile(0.5),
+            'p95_ms': self.quantile(0.95),
+            'max_ms': round(self.max, 3),
+            'buckets': {
+                f'<={bound}': count
+                for bound, count in zip(BUCKETS_MS, self.counts) if count
+            } | ({f'>{BUCKETS_MS[-1]}': self.counts[-1]} if self.counts[-1] else {})
+        }
+
+
+class AttachMetrics:
+    '''
+        Attach stage histograms per target type. Shared by all profiles
+        of a launcher, so `record` is thread-safe.
+    '''
+
+    def __init__(self) -> None:
+        self._lock: Lock = Lock()
+        self._histograms: Dict[str, Dict[str, Histogram]] = {}
+        self.incomplete: int = 0
+
+    def record(self, target_type: str, announced: float, stages: Dict[str, float]) -> None:
+        '''
+            :param target_type: str - like: "page", "service_worker"
+            :param announced: float - `perf_counter()` of the target event
+            :param stages: dict - {stage: perf_counter()}, missing stages
+                mean the target went away before reaching them
+        '''
+
+        with self._lock:
+            histograms = self._histograms.setdefault(
+                target_type or 'other', {stage: Histogram() for stage in STAGES}
+            )
+
+            for stage, at in stages.items():
+                histograms[stage].observe((at - announced) * 1000)
+
+            self.incomplete += len(stages) < len(STAGES)
+
+    def snapshot(self) -> dict:
+        '''
+            Return `dict`, like: {'page': {'resumed': {'p50_ms': 2, ...}, ...}, ...}
+        '''
+
+        with self._lock:
+            return {
+                'types': {
+                    target_type: {
+                        stage: histogram.as_dict()
+                        for stage, histogram in histograms.items()
+                    }
+                    for target_type, histograms in self._histograms.items()
+                },
+                'incomplete': self.incomplete
+            }
+
+
+def format_snapshot(snapshot: dict) -> str:
+    '''
+        Text table of `AttachMetrics.snapshot()`
+    '''
+
+    lines = [
+        f'{"type":<16}{"stage":<11}{"count":>7}{"mean":>10}{"p50":>8}{"p95":>8}{"max":>10}'
+    ]
+
+    for target_type, stages in sorted(snapshot['types'].items()):
+        for stage in STAGES:
+            if not (row := stages.get(stage, None)) or not row['count']:
+                continue
+
+            lines.append(
+                f'{target_type:<16}{stage:<11}{row["count"]:>7}'
+                f'{row["mean_ms"]:>10.2f}{row["p50_ms"]:>8.2f}{row["p95_ms"]:>8.2f}'
+                f'{row["max_ms"]:>10.2f}'
+            )
+
+    lines.append(f'incomplete attaches: {snapshot["incomplete"]}  (ms from target event)')
+
+    return '\n'.join(lines)
+
+
+async def _fetch(url: str) -> dict:
+    async with ClientSession() as session:
+        async with session.get(url) as resp:
+            return loads(await resp.text())
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Dump attach latency histograms')
+    parser.add_argument('--url', default='http://127.0.0.1:8080/metrics/attach')
+    parser.add_argument('--json', action='store_true', help='raw JSON output')
+    args = parser.parse_args()
+
+    data = run(_fetch(args.url))
+    # Web interface with workers: {worker_url: snapshot}
+    snapshots = {args.url: data} if 'types' in data else data
+
+    for source, snapshot in snapshots.items():
+        if args.json:
+            print(dumps({source: snapshot}, indent=4))
+        elif snapshot:
+            print(f'# {source}\n{format_snapshot(snapshot)}\n')
@@ -0,0 +1,169 @@
+'''
+    Write-behind JSON persister.
+
+    Changes are only marked (`mark_dirty()`), the data is written at most
+    once per debounce window. Every write is atomic: temp file in the same
+    directory, fsync, rename over the target, fsync of the directory. A
+    crash leaves either the previous or the new file, never a torn one.
+
+    `write_error_log` appends to `errors.log` from threads and sync code,
+    in the format of `ChromeDebugg._write_error_log`.
+'''
+
+
+from asyncio import Lock, Task, get_running_loop, shield, sleep, to_thread
+from datetime import datetime
+from json import dumps
+from os import O_RDONLY, close as os_close, fsync, open as os_open, replace, unlink
+from os.path import abspath, basename, dirname
+from tempfile import NamedTemporaryFile
+from typing import Callable
+
+
+def write_error_log(function: str, error: Exception) -> None:
+    '''
+        Append error to `errors.log`, never raises
+
+        :param function: str - function name
+        :param error: Exception - any catched exception
+    '''
+
+    try:
+        with open('errors.log', 'a', encoding='utf-8') as err_file:
+            err_file.write(
+                f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
+                f'At `{function}` error: {error}\n'
+            )
+    except OSError:
+        pass
+
+
+def atomic_write(path: str, data: str) -> None:
+    '''
+        Replace file content atomically
+
+        :param path: str - target file
+        :param data: str - new content
+    '''
+
+    directory = dirname(abspath(path))
+
+    with NamedTemporaryFile(
+        'w', encoding='utf-8', dir=directory, prefix=f'.{basename(path)}.',
+        suffix='.tmp', delete=False
+    ) as file:
+        try:
+            file.write(data)
+            file.flush()
+            fsync(file.fileno())
+        except BaseException:
+            unlink(file.name)
+            raise
+
+    replace(file.name, path)
+
+    # Persist the rename itself
+    try:
+        fd = os_open(directory, O_RDONLY)
+    except OSError:
+        return
+
+    try:
+        fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os_close(fd)
+
+
+class JSONPersister:
+    '''
+        Coalesce changes of a JSON document into one atomic write per
+        debounce window
+
+        :param path: str - JSON file
+        :param data: callable - returns the document to save
+        :param debounce: float - seconds between first change and write
+    '''
+
+    def __init__(
+        self, path: str, data: Callable[[], object], debounce: float = 0.5
+    ) -> None:
+        self._path: str = path
+        self._data: Callable[[], object] = data
+        self._debounce: float = debounce
+
+        self._lock: Lock = Lock()
+        self._task: Task = None
+        self._dirty: bool = False
+
+        self.changes: int = 0
+        self.writes: int = 0
+
+    @property
+    def dirty(self) -> bool:
+        return self._dirty
+
+    def mark_dirty(self) -> None:
+        '''
+            Register a change, the write is scheduled once per window.
+            Must be called from the event loop.
+        '''
+
+        self._dirty = True
+        self.changes += 1
+
+        if self._task is None or self._task.done():
+            self._task = get_running_loop().create_task(self._delayed_flush())
+
+    async def _delayed_flush(self) -> None:
+        # Changes made during a write start the next window
+        while self._dirty:
+            await sleep(self._debounce)
+            # A write in progress is finished even if `close()` cancels us
+            await shield(self.flush())
+
+    async def flush(self) -> None:
+        '''
+            Write now if there are unsaved changes
+        '''
+
+        async with self._lock:
+            if not self._dirty:
+                return
+
+            # Taken in the loop, so the snapshot is consistent
+            snapshot = self._snapshot()
+            self._dirty = False
+
+            try:
+                result = await to_thread(self._write, snapshot)
+            except BaseException:
+                self._dirty = True
+                raise
+
+            self._written(result)
+            self.writes += 1
+
+    def _snapshot(self) -> object:
+        return dumps(self._data(), indent=4)
+
+    def _write(self, snapshot: object) -> object:
+        '''
+            Runs in a thread, the result is passed to `_written()`
+        '''
+
+        atomic_write(self._path, snapshot)
+
+    def _written(self, result: object) -> None:
+        pass
+
+    async def close(self) -> None:
+        '''
+            Flush on shutdown
+        '''
+
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+        await self.flush()
@@ -0,0 +1,217 @@
+'''
+    Profile records of `profiles.json`.
+
+    `new_profile` builds the record stored per UUID, shared by the create
+    form and bulk import, so both produce the same schema.
+
+    `ProfileStore` shares `profiles.json` between processes (web workers
+    and the backend): reads reload the file once another process replaced
+    it, changes are merged into the current file under an `fcntl` lock.
+'''
+
+
+from datetime import datetime
+from html import escape as html_escape
+from json import dumps, loads
+from os import stat
+from typing import Dict, List, Optional, Tuple
+
+from helpers.persist import JSONPersister, atomic_write
+from local_socks.upstreams import ProxySpec
+
+try:
+    from fcntl import LOCK_EX, flock
+except ImportError:
+    flock = None
+
+
+def new_profile(
+    root: str, uuid: str, name: str, proxy: ProxySpec, lat: float, lon: float,
+    cpu: int = 0, ram: int = 0, desc: str = '', launch_args: List[str] = (),
+    template: str = ''
+) -> dict:
+    '''
+        :param root: str - app dir, user-data-dir is `{root}/profiles/{uuid}`
+        :param uuid: str - profile UUID
+        :param name: str - profile name
+        :param proxy: str | list - parsed proxy, see `local_socks.upstreams`
+        :param lat: float - latitude
+        :param lon: float - longitude
+        :param cpu: int - `navigator.hardwareConcurrency`, 0 keeps real value
+        :param ram: int - `navigator.deviceMemory`, 0 keeps real value
+        :param desc: str - description, raw text
+        :param launch_args: list - per-profile Chrome args
+        :param template: str - template the user-data-dir was cloned from
+
+        Return `dict` - profile record
+    '''
+
+    return {
+        'name': name,
+        'created': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'path': f'{root}/profiles/{uuid}',
+        'template': template,
+        'proxy': proxy,
+        'desc': html_escape(desc),
+        'launch_args': list(launch_args),
+        'spoofing': {
+            'geo': {
+                'lat': lat,
+                'lon': lon
+            },
+            'hardware': {
+                'cpu': cpu,
+                'ram': ram
+            }
+        }
+    }
+
+
+def _stamp(path: str) -> Optional[Tuple[int, int, int]]:
+    '''
+        File identity: `atomic_write` replaces the inode, so any write by
+        any process changes it
+
+        Return `tuple` - (inode, mtime ns, size), `None` if missing
+    '''
+
+    try:
+        info = stat(path)
+    except FileNotFoundError:
+        return None
+
+    return info.st_ino, info.st_mtime_ns, info.st_size
+
+
+class ProfileStore(JSONPersister):
+    '''
+        Profiles of `profiles.json` shared by several processes.
+        Changes are kept per UUID till written behind (see `JSONPersister`),
+        then merged into the file as it is at write time, so processes
+        never drop each other's changes. Profiles are replaced with `put()`,
+        never changed in place.
+
+        :param path: str - `profiles.json`
+        :param debounce: float - seconds between first change and write
+    '''
+
+    def __init__(self, path: str, debounce: float = 0.5) -> None:
+        super().__init__(path, None, debounce)
+
+        self._lock_path: str = f'{path}.lock'
+        self._profiles: Dict[str, dict] = {}
+        self._stamp: Optional[Tuple[int, int, int]] = None
+        # {uuid: profile}, `None` for deleted profiles
+        self._pending: Dict[str, Optional[dict]] = {}
+
+        self.reloads: int = 0
+
+        self.refresh()
+
+    def refresh(self) -> bool:
+        '''
+            Reload if another process replaced the file, unsaved changes
+            of this process are kept
+
+            Return `bool` - `True` if reloaded
+        '''
+
+        if (stamp := _stamp(self._path)) == self._stamp:
+            return False
+
+        profiles = {}
+
+        if stamp is not None:
+            with open(self._path, 'r', encoding='utf-8') as file:
+                profiles = loads(file.read())
+
+        self._apply(profiles, self._pending)
+        self._profiles, self._stamp = profiles, stamp
+        self.reloads += 1
+
+        return True
+
+    @staticmethod
+    def _apply(profiles: Dict[str, dict], changes: Dict[str, Optional[dict]]) -> None:
+        for uuid, profile in changes.items():
+            if profile is None:
+                profiles.pop(uuid, None)
+            else:
+                profiles[uuid] = profile
+
+    @property
+    def profiles(self) -> Dict[str, dict]:
+        '''
+            Current profiles, read only: change them with `put()` / `pop()`
+        '''
+
+        self.refresh()
+
+        return self._profiles
+
+    def __contains__(self, uuid: str) -> bool:
+        return uuid in self.profiles
+
+    def get(self, uuid: str, default: Optional[dict] = None) -> Optional[dict]:
+        return self.profiles.get(uuid, default)
+
+    def items(self):
+        return self.profiles.items()
+
+    def values(self):
+        return self.profiles.values()
+
+    def put(self, uuid: str, profile: dict) -> None:
+        self.put_many({uuid: profile})
+
+    def put_many(self, profiles: Dict[str, dict]) -> None:
+        '''
+            Add or replace profiles, written once for all of them
+        '''
+
+        self.refresh()
+        self._profiles.update(profiles)
+        self._pending.update(profiles)
+        self.mark_dirty()
+
+    def pop(self, uuid: str) -> Optional[dict]:
+        '''
+            Return `dict` - removed profile, `None` if unknown
+        '''
+
+        if (profile := self.profiles.pop(uuid, None)) is not None:
+            self._pending[uuid] = None
+            self.mark_dirty()
+
+        return profile
+
+    def _snapshot(self) -> Dict[str, Optional[dict]]:
+        return dict(self._pending)
+
+    def _write(self, changes: Dict[str, Optional[dict]]) -> tuple:
+        with open(self._lock_path, 'a') as lock:
+            if flock is not None:
+                # Released with the file
+                flock(lock.fileno(), LOCK_EX)
+
+            try:
+                with open(self._path, 'r', encoding='utf-8') as file:
+                    profiles = loads(file.read())
+            except FileNotFoundError:
+                profiles = {}
+
+            self._apply(profiles, changes)
+            atomic_write(self._path, dumps(profiles, indent=4))
+
+            return changes, profiles, _stamp(self._path)
+
+    def _written(self, result: tuple) -> None:
+        changes, profiles, stamp = result
+
+        # Changes made while writing stay pending for the next write
+        for uuid, profile in changes.items():
+            if uuid in self._pending and self._pending[uuid] is profile:
+                del self._pending[uuid]
+
+        self._apply(profiles, self._pending)
+        self._profiles, self._stamp = profiles, stamp
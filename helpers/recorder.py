@@ -0,0 +1,102 @@
+'''
+    CDP traffic recorder.
+
+    Captures browser-level and target-level WebSocket frames of a real
+    session to a gzip compressed NDJSON file, used by the offline replay
+    harness in `benchmarks/`.
+
+    File layout: first line is a header `{"version": 1, "created": ...}`,
+    every next line is `[offset_s, channel, direction, frame]`, where
+    channel is "browser" or TabID and direction is "in" or "out".
+'''
+
+
+from gzip import open as gzip_open
+from json import dumps, loads
+from threading import Lock
+from time import perf_counter, time
+from typing import Iterator, List, Tuple
+
+
+RECORDING_VERSION: int = 1
+
+
+class CDPRecorder:
+    '''
+        Thread safe frame recorder, shared by the browser and target loops
+
+        :param path: str - output file, like: "session.cdp.gz"
+        :param compresslevel: int - gzip level, low levels keep recording cheap
+    '''
+
+    def __init__(self, path: str, compresslevel: int = 3) -> None:
+        self._file = gzip_open(path, 'wt', encoding='utf-8', compresslevel=compresslevel)
+        self._lock: Lock = Lock()
+        self._started: float = perf_counter()
+
+        self._file.write(
+            dumps({'version': RECORDING_VERSION, 'created': time()}) + '\n'
+        )
+
+    def record(self, channel: str, direction: str, frame: str) -> None:
+        '''
+            Record single frame
+
+            :param channel: str - "browser" or TabID, like: "28910AAK39K"
+            :param direction: str - "in" (from Chrome) or "out" (to Chrome)
+            :param frame: str - raw frame
+
+            Return `None`
+        '''
+
+        line = dumps(
+            [round(perf_counter() - self._started, 6), channel, direction, frame],
+            separators=(',', ':')
+        )
+
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line + '\n')
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def read_recording(path: str) -> Iterator[Tuple[float, str, str, str]]:
+    '''
+        Read frames of recording
+
+        :param path: str - file written by `CDPRecorder`
+
+        Return `Iterator` of `(offset_s, channel, direction, frame)`
+    '''
+
+    with gzip_open(path, 'rt', encoding='utf-8') as file:
+        header = loads(file.readline())
+
+        assert header.get('version', None) == RECORDING_VERSION, \
+            "Unsupported recording version"
+
+        for line in file:
+            offset, channel, direction, frame = loads(line)
+            yield offset, channel, direction, frame
+
+
+def write_recording(
+    path: str, frames: List[Tuple[float, str, str, str]]
+) -> None:
+    '''
+        Write prepared frames, like synthetic sessions, as recording
+
+        :param path: str - output file
+        :param frames: list - `(offset_s, channel, direction, frame)`
+
+        Return `None`
+    '''
+
+    with gzip_open(path, 'wt', encoding='utf-8') as file:
+        file.write(dumps({'version': RECORDING_VERSION, 'created': time()}) + '\n')
+
+        for frame in frames:
+            file.write(dumps(list(frame), separators=(',', ':')) + '\n')
@@ -0,0 +1,499 @@
+'''
+    Profile user-data-dir storage helpers.
+
+    Template profiles: snapshot a warmed Chrome user-data-dir once and clone
+    it for new profiles with reflinks (`FICLONE`), `copy_file_range`, or a
+    plain copy as last resort. Files are never hardlinked: Chrome rewrites
+    cache entries in place, shared inodes would leak one profile's state
+    into the template and its other clones.
+
+    Deletion: profile dirs are renamed into a trash dir and removed by a
+    throttled, low-priority reaper thread. `DiskUsageIndex` reports bytes
+    per profile and trims Chrome caches above a quota.
+'''
+
+
+from errno import EBADF, EINVAL, ENOSYS, ENOTSUP, ENOTTY, EOPNOTSUPP, EXDEV
+from json import dumps, loads
+from os import (
+    fstat,
+    makedirs,
+    readlink,
+    remove,
+    rename,
+    replace,
+    rmdir,
+    scandir,
+    symlink
+)
+from os.path import basename, exists, isdir, join
+from shutil import copyfile, copystat, rmtree
+from sys import platform
+from threading import Event, Thread, get_native_id
+from time import monotonic, sleep, time
+from typing import Callable, Dict, Iterator, List, Optional
+
+from helpers.persist import write_error_log
+
+try:
+    from fcntl import ioctl
+except ImportError:
+    ioctl = None
+
+try:
+    from os import copy_file_range
+except ImportError:
+    copy_file_range = None
+
+try:
+    from os import PRIO_PROCESS, setpriority
+except ImportError:
+    setpriority = None
+
+
+# `_IOW(0x94, 9, int)`, Linux reflink ioctl (btrfs, xfs, bcachefs, ...)
+FICLONE: int = 0x40049409
+
+# Chrome lock/runtime files, never part of a snapshot
+SKIP_FILES: tuple = (
+    'SingletonLock', 'SingletonSocket', 'SingletonCookie',
+    'lockfile', 'LOCK', 'RunningChromeVersion'
+)
+
+# Chrome cache subdirectories of user-data-dir, safe to drop when closed
+CACHE_DIRS: tuple = (
+    'Default/Cache', 'Default/Code Cache', 'Default/GPUCache',
+    'GrShaderCache', 'GraphiteDawnCache', 'ShaderCache'
+)
+
+_UNSUPPORTED: tuple = (EBADF, EINVAL, ENOSYS, ENOTSUP, ENOTTY, EOPNOTSUPP, EXDEV)
+
+
+class TreeCloner:
+    '''
+        Copy a directory tree with the cheapest method the filesystem supports.
+        Unsupported methods are disabled after the first failure.
+    '''
+
+    def __init__(self) -> None:
+        self._reflink: bool = ioctl is not None and platform.startswith('linux')
+        self._copy_range: bool = copy_file_range is not None
+
+        self.stats: Dict[str, int] = {
+            'reflink': 0, 'copy_file_range': 0, 'copy': 0, 'bytes': 0
+        }
+
+    def _reflink_file(self, src: str, dst: str) -> bool:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            try:
+                ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED:
+                    raise
+                self._reflink = False
+                return False
+
+        return True
+
+    def _copy_range_file(self, src: str, dst: str) -> bool:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            remaining = fstat(fsrc.fileno()).st_size
+
+            try:
+                while remaining > 0:
+                    copied = copy_file_range(
+                        fsrc.fileno(), fdst.fileno(), min(remaining, 1 << 30)
+                    )
+                    if not copied:
+                        break
+                    remaining -= copied
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED:
+                    raise
+                self._copy_range = False
+                return False
+
+        return True
+
+    def clone_file(self, src: str, dst: str) -> None:
+        '''
+            Clone single file
+
+            :param src: str - source file
+            :param dst: str - destination file, must not exist
+        '''
+
+        if self._reflink and self._reflink_file(src, dst):
+            self.stats['reflink'] += 1
+        elif self._copy_range and self._copy_range_file(src, dst):
+            self.stats['copy_file_range'] += 1
+        else:
+            copyfile(src, dst)
+            self.stats['copy'] += 1
+
+        copystat(src, dst)
+
+    def clone_tree(self, src: str, dst: str) -> None:
+        '''
+            Clone directory tree, skipping Chrome lock files
+
+            :param src: str - source directory
+            :param dst: str - destination directory
+        '''
+
+        makedirs(dst, exist_ok=True)
+
+        with scandir(src) as entries:
+            for entry in entries:
+                if entry.name in SKIP_FILES:
+                    continue
+
+                target = join(dst, entry.name)
+
+                if entry.is_symlink():
+                    symlink(readlink(entry.path), target)
+                elif entry.is_dir():
+                    self.clone_tree(entry.path, target)
+                else:
+                    self.clone_file(entry.path, target)
+                    self.stats['bytes'] += entry.stat().st_size
+
+        copystat(src, dst)
+
+
+class ProfileTemplates:
+    '''
+        Snapshots of warmed Chrome user-data-dirs
+
+        :param root: str - templates directory, like: "profiles/.templates"
+    '''
+
+    META_FILE: str = 'template.json'
+
+    def __init__(self, root: str) -> None:
+        self._root: str = root
+
+        makedirs(root, exist_ok=True)
+
+    def _path(self, name: str) -> str:
+        assert name and '/' not in name and not name.startswith('.'), \
+            "Invalid template name"
+
+        return join(self._root, name)
+
+    def list(self) -> List[dict]:
+        '''
+            Available templates
+
+            Return `List[dict]`, like: [{'name': ..., 'source': ..., 'created': ...}]
+        '''
+
+        templates = []
+
+        with scandir(self._root) as entries:
+            for entry in entries:
+                meta = join(entry.path, self.META_FILE)
+
+                if entry.is_dir() and not entry.name.endswith('.tmp') \
+                        and exists(meta):
+                    with open(meta, 'r', encoding='utf-8') as file:
+                        templates.append({'name': entry.name, **loads(file.read())})
+
+        return sorted(templates, key=lambda item: item['name'])
+
+    def snapshot(self, src: str, name: str) -> dict:
+        '''
+            Snapshot user-data-dir as template. Chrome must not be running.
+
+            :param src: str - profile user-data-dir
+            :param name: str - template name, replaces existing one
+
+            Return `dict` - clone stats
+        '''
+
+        assert isdir(src), "Profile directory does not exist"
+
+        dst = self._path(name)
+        tmp = f'{dst}.tmp'
+
+        rmtree(tmp, ignore_errors=True)
+
+        cloner = TreeCloner()
+        cloner.clone_tree(src, tmp)
+
+        with open(join(tmp, self.META_FILE), 'w', encoding='utf-8') as file:
+            file.write(dumps({'source': src, 'created': time()}))
+
+        rmtree(dst, ignore_errors=True)
+        replace(tmp, dst)
+
+        return cloner.stats
+
+    def clone(self, name: str, dst: str) -> dict:
+        '''
+            Create profile user-data-dir from template
+
+            :param name: str - template name
+            :param dst: str - new profile directory, must not exist
+
+            Return `dict` - clone stats
+        '''
+
+        src = self._path(name)
+
+        assert exists(join(src, self.META_FILE)), "Unknown template"
+        assert not exists(dst), "Profile directory already exists"
+
+        cloner = TreeCloner()
+        cloner.clone_tree(src, dst)
+
+        remove(join(dst, self.META_FILE))
+
+        return cloner.stats
+
+    def remove(self, name: str) -> None:
+        rmtree(self._path(name), ignore_errors=True)
+
+
+def tree_size(path: str) -> int:
+    '''
+        Disk usage of directory tree with `os.scandir`.
+        Allocated blocks on POSIX, file sizes elsewhere.
+
+        :param path: str - directory
+
+        Return `int` - bytes
+    '''
+
+    total = 0
+    stack = [path]
+
+    while stack:
+        try:
+            with scandir(stack.pop()) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                            continue
+
+                        stat = entry.stat(follow_symlinks=False)
+                        total += getattr(stat, 'st_blocks', 0) * 512 or stat.st_size
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+
+    return total
+
+
+class ProfileReaper:
+    '''
+        Asynchronous profile deletion.
+        `trash()` renames the profile into the trash dir (O(1), same
+        filesystem), a background thread deletes it with `os.scandir`
+        at most `rate` entries per second at the lowest CPU priority.
+
+        :param root: str - trash directory, like: "profiles/.trash"
+        :param rate: int - max deleted entries per second
+    '''
+
+    def __init__(self, root: str, rate: int = 2000) -> None:
+        self._root: str = root
+        self._rate: int = max(1, rate)
+        self._wake: Event = Event()
+        self._stopped: Event = Event()
+        self._thread: Thread = None
+
+        self.deleted: int = 0
+
+        makedirs(root, exist_ok=True)
+
+    def trash(self, path: str) -> Optional[str]:
+        '''
+            Move directory into trash and wake the reaper
+
+            :param path: str - profile directory
+
+            Return `str` - path in trash, `None` if `path` does not exist
+        '''
+
+        target = join(self._root, f'{basename(path.rstrip("/"))}-{time():.6f}')
+
+        try:
+            rename(path, target)
+        except FileNotFoundError:
+            return None
+
+        self._wake.set()
+
+        return target
+
+    def _iter_delete(self, path: str) -> Iterator[None]:
+        '''
+            Post-order delete, yields after every removed entry
+        '''
+
+        stack = [(path, False)]
+
+        while stack:
+            current, scanned = stack.pop()
+
+            if scanned:
+                try:
+                    rmdir(current)
+                except OSError:
+                    pass
+                yield
+                continue
+
+            stack.append((current, True))
+
+            try:
+                with scandir(current) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append((entry.path, False))
+                            continue
+
+                        try:
+                            remove(entry.path)
+                        except OSError:
+                            pass
+                        yield
+            except OSError:
+                continue
+
+    def _run(self) -> None:
+        if setpriority is not None:
+            try:
+                setpriority(PRIO_PROCESS, get_native_id(), 19)
+            except OSError:
+                pass
+
+        batch = max(1, self._rate // 20)
+
+        while not self._stopped.is_set():
+            self._wake.wait(60)
+            self._wake.clear()
+
+            # A failing entry or scan is logged and retried on the next
+            # wake, the thread must not die
+            try:
+                makedirs(self._root, exist_ok=True)
+
+                with scandir(self._root) as entries:
+                    paths = [entry.path for entry in entries]
+            except OSError as e:
+                write_error_log('ProfileReaper._run', e)
+                continue
+
+            for path in paths:
+                if not isdir(path):
+                    try:
+                        remove(path)
+                    except FileNotFoundError:
+                        pass
+                    except OSError as e:
+                        write_error_log('ProfileReaper._run', e)
+                    continue
+
+                started, count = monotonic(), 0
+
+                for _ in self._iter_delete(path):
+                    count += 1
+                    self.deleted += 1
+
+                    if count % batch:
+                        continue
+
+                    if self._stopped.is_set():
+                        return
+
+                    # Keep the average below `rate` entries per second
+                    if (delay := count / self._rate - (monotonic() - started)) > 0:
+                        sleep(delay)
+
+    def start(self) -> None:
+        '''
+            Start reaper thread, pending trash is deleted right away
+        '''
+
+        if self._thread is None:
+            self._thread = Thread(target=self._run, name='ProfileReaper', daemon=True)
+            self._thread.start()
+            self._wake.set()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._wake.set()
+
+        if self._thread is not None:
+            self._thread.join(5)
+            self._thread = None
+
+
+class DiskUsageIndex:
+    '''
+        Bytes used per profile, optional cache quota
+
+        :param reaper: ProfileReaper - trimmed caches are moved to its trash
+        :param cache_quota: int - max cache bytes per profile, `None` to disable
+        :param cache_dirs: tuple - cache subdirectories of user-data-dir
+    '''
+
+    def __init__(
+        self, reaper: ProfileReaper, cache_quota: Optional[int] = None,
+        cache_dirs: tuple = CACHE_DIRS
+    ) -> None:
+        self._reaper: ProfileReaper = reaper
+        self._cache_quota: Optional[int] = cache_quota
+        self._cache_dirs: tuple = cache_dirs
+
+        self.usage: Dict[str, dict] = {}
+
+    def scan(
+        self, profiles: Dict[str, str],
+        is_running: Callable[[str], bool] = lambda uuid: False
+    ) -> Dict[str, dict]:
+        '''
+            Rescan profiles and trim caches of closed profiles above quota.
+            Blocking, run with `to_thread`.
+
+            :param profiles: dict - {uuid: user-data-dir}
+            :param is_running: Callable - `True` if profile browser is open
+
+            Return `dict` - {uuid: {'bytes': ..., 'cache_bytes': ..., 'trimmed': ...}}
+        '''
+
+        usage = {}
+
+        for uuid, path in profiles.items():
+            caches = {
+                cache: tree_size(join(path, cache)) for cache in self._cache_dirs
+                if isdir(join(path, cache))
+            }
+            total = tree_size(path) if isdir(path) else 0
+            trimmed = 0
+
+            if self._cache_quota is not None and not is_running(uuid) \
+                    and sum(caches.values()) > self._cache_quota:
+                # Largest caches first, till the rest fits into the quota
+                for cache, size in sorted(caches.items(), key=lambda item: -item[1]):
+                    if sum(caches.values()) <= self._cache_quota:
+                        break
+
+                    if self._reaper.trash(join(path, cache)):
+                        trimmed += size
+                        caches[cache] = 0
+
+            usage[uuid] = {
+                'bytes': total - trimmed,
+                'cache_bytes': sum(caches.values()),
+                'trimmed': trimmed,
+                'scanned': time()
+            }
+
+        self.usage = usage
+
+        return usage
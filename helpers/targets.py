@@ -0,0 +1,265 @@
+'''
+    Target registry of one `ChromeDebugg` session.
+
+    Tracks every CDP target through its states: discovered (announced by
+    `Target.targetCreated` / `Target.attachedToTarget`), attaching (socket
+    task started), attached (socket connected), detached and filtered
+    (skipped by `TargetFilter`). Lookups are
+    O(1), detached targets are evicted after a TTL. All calls come from
+    the profile event loop, so no lock is needed.
+
+    `TargetFilter` limits which targets get a debugger session at all.
+'''
+
+
+from time import monotonic
+from typing import Dict, List, Mapping, Optional, Tuple
+
+
+DISCOVERED: str = 'discovered'
+ATTACHING: str = 'attaching'
+ATTACHED: str = 'attached'
+DETACHED: str = 'detached'
+FILTERED: str = 'filtered'
+
+# Targets that can run page JS and so need emulations
+DEFAULT_TYPES: Tuple[str, ...] = (
+    'page', 'iframe', 'worker', 'shared_worker', 'service_worker'
+)
+# Browser-internal pages. Not `chrome:`: new tabs start at
+# chrome://newtab and keep their target when navigating away
+DEFAULT_EXCLUDE_SCHEMES: Tuple[str, ...] = (
+    'chrome-extension:', 'chrome-untrusted:', 'devtools:'
+)
+
+
+class TargetFilter:
+    '''
+        Which targets to attach to. Types are filtered by Chrome (CDP
+        `filter` of `setAutoAttach` / `setDiscoverTargets`), URL schemes
+        only on the client side.
+
+        :param types: tuple - target types to attach, like: ("page", "iframe")
+        :param exclude_schemes: tuple - URL schemes to skip, like: ("chrome:",)
+    '''
+
+    def __init__(
+        self, types: Tuple[str, ...] = DEFAULT_TYPES,
+        exclude_schemes: Tuple[str, ...] = DEFAULT_EXCLUDE_SCHEMES
+    ) -> None:
+        self.types: frozenset = frozenset(types)
+        self.exclude_schemes: Tuple[str, ...] = tuple(exclude_schemes)
+
+    @classmethod
+    def from_config(cls, config: Mapping) -> 'TargetFilter':
+        '''
+            Create from `chrome_settings.json`['targets']
+        '''
+
+        return cls(
+            tuple(config.get('types', DEFAULT_TYPES)),
+            tuple(config.get('exclude_schemes', DEFAULT_EXCLUDE_SCHEMES))
+        )
+
+    def cdp_filter(self) -> List[dict]:
+        '''
+            `Target.TargetFilter`: first matching entry wins, targets
+            matching no entry are excluded
+
+            Return `List[dict]`, like: [{"type": "page"}, {"type": "iframe"}]
+        '''
+
+        return [{'type': target_type} for target_type in sorted(self.types)]
+
+    def accepts(self, target_type: str, url: str = '') -> bool:
+        return target_type in self.types and not url.startswith(self.exclude_schemes)
+
+
+class TargetEntry:
+    __slots__ = ('tid', 'type', 'url', 'state', 'changed')
+
+    def __init__(self, tid: str, type: str = '', url: str = '') -> None:
+        self.tid: str = tid
+        self.type: str = type
+        self.url: str = url
+        self.state: str = DISCOVERED
+        self.changed: float = monotonic()
+
+    def as_dict(self) -> dict:
+        return {
+            'tid': self.tid, 'type': self.type, 'url': self.url,
+            'state': self.state
+        }
+
+
+class TargetRegistry:
+    '''
+        Targets by TabID with state and race counters
+
+        :param ttl: float - seconds a detached target is kept, so its
+            restart is counted as `reattached`
+    '''
+
+    def __init__(self, ttl: float = 60) -> None:
+        self._ttl: float = ttl
+        self._targets: Dict[str, TargetEntry] = {}
+        self._next_eviction: float = monotonic() + ttl
+
+        self.counters: Dict[str, int] = {
+            'discovered': 0,
+            # Second event for a target already attaching/attached
+            'attach_races': 0,
+            # Announced again after it was detached
+            'reattached': 0,
+            # Socket closed before it was attached
+            'failed': 0,
+            # Skipped by `TargetFilter`
+            'filtered': 0,
+            'evicted': 0
+        }
+        # {type: {'attached': n, 'filtered': n}}
+        self.by_type: Dict[str, Dict[str, int]] = {}
+
+    def __contains__(self, tid: str) -> bool:
+        return tid in self._targets
+
+    def __len__(self) -> int:
+        return len(self._targets)
+
+    def get(self, tid: str) -> Optional[TargetEntry]:
+        return self._targets.get(tid, None)
+
+    def _set(self, entry: TargetEntry, state: str) -> None:
+        entry.state = state
+        entry.changed = monotonic()
+
+    def discover(self, tid: str, type: str = '', url: str = '') -> TargetEntry:
+        '''
+            Register announced target, repeated announcements are merged
+
+            :param tid: str - TabID like: "28910AAK39K"
+            :param type: str - target type, like: "page", "service_worker"
+            :param url: str - target URL
+
+            Return `TargetEntry`
+        '''
+
+        self.evict()
+
+        if (entry := self._targets.get(tid, None)) is None:
+            entry = self._targets[tid] = TargetEntry(tid, type, url)
+            self.counters['discovered'] += 1
+        else:
+            entry.type = type or entry.type
+            entry.url = url or entry.url
+
+        return entry
+
+    def begin_attach(self, tid: str) -> bool:
+        '''
+            Claim target for attaching. Only the first claim wins, so a
+            target announced by several events gets one socket.
+
+            Return `bool` - `True` if caller should attach
+        '''
+
+        entry = self._targets.get(tid, None) or self.discover(tid)
+
+        if entry.state == DISCOVERED:
+            self._set(entry, ATTACHING)
+            self._count_type(entry.type, 'attached')
+            return True
+
+        if entry.state == FILTERED:
+            return False
+
+        if entry.state == DETACHED:
+            # Detached target announced again: late event or a restart
+            # (service workers). Attach again, once.
+            self.counters['reattached'] += 1
+            self._set(entry, ATTACHING)
+            return True
+
+        self.counters['attach_races'] += 1
+        return False
+
+    def _count_type(self, target_type: str, key: str) -> None:
+        counts = self.by_type.setdefault(
+            target_type or 'other', {'attached': 0, 'filtered': 0}
+        )
+        counts[key] += 1
+
+    def filtered(self, tid: str) -> bool:
+        '''
+            Mark target as skipped by `TargetFilter`
+
+            Return `bool` - `True` the first time, so it is released once
+        '''
+
+        entry = self._targets.get(tid, None) or self.discover(tid)
+
+        if entry.state == FILTERED:
+            return False
+
+        self.counters['filtered'] += 1
+        self._count_type(entry.type, 'filtered')
+        self._set(entry, FILTERED)
+
+        return True
+
+    def attached(self, tid: str) -> None:
+        if entry := self._targets.get(tid, None):
+            self._set(entry, ATTACHED)
+
+    def detached(self, tid: str) -> None:
+        if not (entry := self._targets.get(tid, None)):
+            return
+
+        if entry.state == ATTACHING:
+            self.counters['failed'] += 1
+
+        self._set(entry, DETACHED)
+
+    def evict(self, force: bool = False) -> int:
+        '''
+            Drop detached targets older than TTL. Runs at most once per TTL
+            unless `force` is set.
+
+            Return `int` - evicted targets
+        '''
+
+        now = monotonic()
+
+        if not force and now < self._next_eviction:
+            return 0
+
+        self._next_eviction = now + self._ttl
+        expired = [
+            tid for tid, entry in self._targets.items()
+            if entry.state in (DETACHED, FILTERED) and now - entry.changed >= self._ttl
+        ]
+
+        for tid in expired:
+            del self._targets[tid]
+
+        self.counters['evicted'] += len(expired)
+
+        return len(expired)
+
+    def status(self) -> dict:
+        '''
+            Targets per state plus counters
+
+            Return `dict`, like: {'states': {'attached': 3, ...}, 'counters': {...}}
+        '''
+
+        states = {}
+
+        for entry in self._targets.values():
+            states[entry.state] = states.get(entry.state, 0) + 1
+
+        return {
+            'states': states,
+            'counters': dict(self.counters),
+            'by_type': {key: dict(value) for key, value in self.by_type.items()}
+        }
@@ -0,0 +1,413 @@
+'''
+    Headless worker node.
+
+    `WorkerAgent` wraps `BatchLauncher` (and so `ChromeDebugg` and
+    `LocalSocks`) behind a small HTTP RPC: launch, stop and status.
+    `WorkerPool` is the web interface side: it schedules profiles onto
+    registered workers by load.
+
+    Both sides share `chrome_settings.json`['worker_token'], sent in
+    `TOKEN_HEADER` with every call: a worker launches whatever profile it
+    is sent, with its proxy credentials. The RPC is plain HTTP, so workers
+    listen on 127.0.0.1 by default; reach other machines over an SSH
+    tunnel or a trusted network.
+
+    CLI: python -m helpers.worker --port 9001 [--token ...] [--register http://127.0.0.1:8080]
+'''
+
+
+from argparse import ArgumentParser
+from asyncio import Lock, gather, run, sleep
+from hmac import compare_digest
+from os import environ, getcwd, getloadavg
+from os.path import abspath
+from socket import gethostname
+from typing import Dict, List, Optional, Set
+
+from aiohttp import ClientSession, ClientTimeout, web
+from aiohttp.client_exceptions import ClientError
+
+from helpers.config import ConfigService
+from helpers.events import EventPipeline
+from helpers.launcher import BatchLauncher
+from helpers.masking import MaskingTools
+
+
+TOKEN_HEADER: str = 'X-Marionette-Token'
+
+
+def token_middleware(token: str):
+    '''
+        aiohttp middleware answering 403 to calls without `token` in
+        `TOKEN_HEADER`. Browsers cannot add the header cross-origin without
+        a CORS preflight, so web pages cannot call the RPC either.
+
+        :param token: str - shared secret
+    '''
+
+    assert token, 'RPC token is not set'
+
+    @web.middleware
+    async def authorize(request: web.Request, handler) -> web.StreamResponse:
+        if not compare_digest(
+            request.headers.get(TOKEN_HEADER, '').encode(), token.encode()
+        ):
+            raise web.HTTPForbidden()
+
+        return await handler(request)
+
+    return authorize
+
+
+class WorkerAgent:
+    '''
+        HTTP RPC around `BatchLauncher`
+
+        :param launcher: BatchLauncher - launcher owning the browsers
+        :param token: str - shared secret, required in `TOKEN_HEADER`
+        :param host: str - listen host
+        :param port: int - listen port
+        :param profiles_dir: str - if set, profiles are stored in
+            `<profiles_dir>/<uuid>` on this worker instead of given `path`
+    '''
+
+    def __init__(
+        self, launcher: BatchLauncher, token: str, host: str = '127.0.0.1',
+        port: int = 9001, profiles_dir: Optional[str] = None
+    ) -> None:
+        self._launcher: BatchLauncher = launcher
+        self._token: str = token
+        self._host: str = host
+        self._port: int = port
+        self._profiles_dir: Optional[str] = profiles_dir and abspath(profiles_dir)
+        self._runner: web.AppRunner = None
+
+    @property
+    def url(self) -> str:
+        return f'http://{self._host}:{self._port}'
+
+    async def start(self) -> None:
+        app = web.Application(middlewares=[token_middleware(self._token)])
+        app.router.add_post('/launch', self._launch)
+        app.router.add_post('/stop/{uuid}', self._stop)
+        app.router.add_get('/status', self._status)
+        app.router.add_get('/metrics', self._metrics)
+
+        self._runner = web.AppRunner(app, handle_signals=False)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self._host, self._port).start()
+
+    async def stop(self) -> None:
+        await self._launcher.stop_all()
+
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _launch(self, request: web.Request) -> web.Response:
+        '''
+            Body: {"uuid": "...", "profile": {...}}
+        '''
+
+        body = await request.json()
+        uuid, profile = body['uuid'], dict(body['profile'])
+
+        if self._profiles_dir:
+            profile['path'] = f'{self._profiles_dir}/{uuid}'
+
+        return web.json_response(await self._launcher.launch(uuid, profile))
+
+    async def _stop(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            'stopped': await self._launcher.stop(request.match_info['uuid'])
+        })
+
+    async def _status(self, request: web.Request) -> web.Response:
+        status = self._launcher.status()
+
+        try:
+            status['loadavg'] = getloadavg()[0]
+        except OSError:
+            status['loadavg'] = None
+
+        status['host'] = gethostname()
+
+        return web.json_response(status)
+
+    async def _metrics(self, request: web.Request) -> web.Response:
+        return web.json_response(self._launcher.metrics.snapshot())
+
+
+class WorkerPool:
+    '''
+        Schedule profiles onto registered workers by load
+
+        :param workers: list - worker URLs, like: ["http://127.0.0.1:9001"]
+        :param token: str - `worker_token` of the workers, calls fail
+            without it
+        :param timeout: float - RPC timeout for status calls
+    '''
+
+    def __init__(
+        self, workers: List[str] = None, token: Optional[str] = None, timeout: float = 5
+    ) -> None:
+        self.workers: List[str] = []
+        self.token: Optional[str] = token
+        self._timeout: float = timeout
+        self._placements: Dict[str, str] = {}
+        # UUIDs between `launch()` call and placement
+        self._reserved: Set[str] = set()
+        self._pending: Dict[str, int] = {}
+        self._pick_lock: Lock = Lock()
+
+        for url in workers or []:
+            self.register(url)
+
+    def __bool__(self) -> bool:
+        return bool(self.workers)
+
+    def _session(self, **kwargs) -> ClientSession:
+        return ClientSession(headers={TOKEN_HEADER: self.token or ''}, **kwargs)
+
+    def register(self, url: str) -> None:
+        '''
+            Register worker
+
+            :param url: str - worker URL, like: "http://127.0.0.1:9001"
+        '''
+
+        url = url.rstrip('/')
+
+        if url not in self.workers:
+            self.workers.append(url)
+            self._pending[url] = 0
+
+    def unregister(self, url: str) -> None:
+        url = url.rstrip('/')
+
+        if url in self.workers:
+            self.workers.remove(url)
+            self._pending.pop(url, None)
+
+    async def _worker_status(self, session: ClientSession, url: str) -> Optional[dict]:
+        try:
+            async with session.get(f'{url}/status') as resp:
+                return await resp.json()
+        except (ClientError, TimeoutError):
+            return None
+
+    async def status(self) -> Dict[str, Optional[dict]]:
+        '''
+            Status of all workers, `None` for unreachable ones
+
+            Return `dict` - {url: status}
+        '''
+
+        async with self._session(timeout=ClientTimeout(self._timeout)) as session:
+            statuses = await gather(*(
+                self._worker_status(session, url) for url in self.workers
+            ))
+
+        return dict(zip(self.workers, statuses))
+
+    async def _worker_metrics(self, session: ClientSession, url: str) -> Optional[dict]:
+        try:
+            async with session.get(f'{url}/metrics') as resp:
+                return await resp.json()
+        except (ClientError, TimeoutError):
+            return None
+
+    async def metrics(self) -> Dict[str, Optional[dict]]:
+        '''
+            Attach latency histograms of all workers, `None` for unreachable ones
+
+            Return `dict` - {url: AttachMetrics.snapshot()}
+        '''
+
+        async with self._session(timeout=ClientTimeout(self._timeout)) as session:
+            snapshots = await gather(*(
+                self._worker_metrics(session, url) for url in self.workers
+            ))
+
+        return dict(zip(self.workers, snapshots))
+
+    async def pick(self) -> Optional[str]:
+        '''
+            Pick least loaded reachable worker with free capacity.
+            Launches in flight are counted, so a batch is spread out.
+
+            Return `str` - worker URL, `None` if all are full or down
+        '''
+
+        async with self._pick_lock:
+            best, best_load = None, None
+
+            for url, status in (await self.status()).items():
+                if not status:
+                    continue
+
+                live = status['live'] + self._pending[url]
+
+                if live >= status['max_live']:
+                    continue
+
+                if best_load is None or live / status['max_live'] < best_load:
+                    best, best_load = url, live / status['max_live']
+
+            if best:
+                self._pending[best] += 1
+
+            return best
+
+    async def _placement(self, uuid: str) -> Optional[str]:
+        '''
+            Worker running the profile. Placements of browsers that were
+            closed on the worker are dropped; an unreachable worker keeps
+            its placements, the browser may still run there.
+
+            Return `str` - worker URL, `None` if not running
+        '''
+
+        if not (url := self._placements.get(uuid, None)):
+            return None
+
+        async with self._session(timeout=ClientTimeout(self._timeout)) as session:
+            status = await self._worker_status(session, url)
+
+        if status is not None and uuid not in status['running']:
+            if self._placements.get(uuid, None) == url:
+                del self._placements[uuid]
+
+            return None
+
+        return url
+
+    async def launch(self, uuid: str, profile: dict) -> dict:
+        '''
+            Launch profile on the least loaded worker. A profile runs on
+            one worker at most, the user-data-dir may be shared.
+
+            :param uuid: str - profile UUID
+            :param profile: dict - profile from `profiles.json`
+
+            Return `dict` - launch timings from worker plus `worker` URL,
+                status "already_running" if placed before
+        '''
+
+        if uuid in self._reserved:
+            return {'uuid': uuid, 'status': 'already_running'}
+
+        self._reserved.add(uuid)
+
+        try:
+            if url := await self._placement(uuid):
+                return {'uuid': uuid, 'status': 'already_running', 'worker': url}
+
+            if not (url := await self.pick()):
+                return {'uuid': uuid, 'status': 'no_capacity'}
+
+            try:
+                async with self._session() as session:
+                    async with session.post(
+                        f'{url}/launch', json={'uuid': uuid, 'profile': profile}
+                    ) as resp:
+                        result = await resp.json()
+            except ClientError as e:
+                return {'uuid': uuid, 'status': 'failed', 'error': str(e), 'worker': url}
+            finally:
+                self._pending[url] = max(0, self._pending.get(url, 1) - 1)
+
+            if result['status'] in ('online', 'running'):
+                self._placements[uuid] = url
+
+            result['worker'] = url
+
+            return result
+        finally:
+            self._reserved.discard(uuid)
+
+    async def launch_batch(self, profiles: Dict[str, dict]) -> List[dict]:
+        return list(await gather(*(
+            self.launch(uuid, profile) for uuid, profile in profiles.items()
+        )))
+
+    async def stop(self, uuid: str) -> bool:
+        if not (url := self._placements.pop(uuid, None)):
+            return False
+
+        try:
+            async with self._session() as session:
+                async with session.post(f'{url}/stop/{uuid}') as resp:
+                    return (await resp.json())['stopped']
+        except ClientError:
+            return False
+
+
+async def _register(web_url: str, worker_url: str, token: str) -> None:
+    '''
+        Register worker in web interface, retry till it is up
+    '''
+
+    while True:
+        try:
+            async with ClientSession(headers={TOKEN_HEADER: token}) as session:
+                async with session.post(
+                    f'{web_url.rstrip("/")}/workers', json={'url': worker_url}
+                ) as resp:
+                    if resp.status == 200:
+                        return
+
+                    if resp.status == 403:
+                        raise SystemExit('Web interface refused `worker_token`')
+        except ClientError:
+            pass
+
+        await sleep(2)
+
+
+async def _cli(args) -> None:
+    config = ConfigService()
+    config.start()
+
+    if not (token := args.token or config.config.worker_token):
+        raise SystemExit(
+            'Set `worker_token` in chrome_settings.json, --token or MM_WORKER_TOKEN'
+        )
+
+    agent = WorkerAgent(
+        BatchLauncher(
+            MaskingTools.from_config(config.config),
+            EventPipeline.from_config(config.config.events),
+            args.concurrency, args.stagger, args.max_live, config=config
+        ),
+        token, args.host, args.port, args.profiles_dir
+    )
+
+    await agent.start()
+    print(f'Worker listening on {agent.url}')
+
+    if args.register:
+        await _register(args.register, agent.url, token)
+
+    try:
+        while True:
+            await sleep(3600)
+    finally:
+        await agent.stop()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Run headless ChromeDebugg worker')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9001)
+    parser.add_argument(
+        '--token', default=environ.get('MM_WORKER_TOKEN', None),
+        help='shared secret, `worker_token` of chrome_settings.json by default'
+    )
+    parser.add_argument('--register', help='web interface URL to register in')
+    parser.add_argument('--profiles-dir', default=f'{getcwd()}/profiles')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--stagger', type=float, default=0.5)
+    parser.add_argument('--max-live', type=int, default=None)
+    args = parser.parse_args()
+
+    run(_cli(args))
@@ -2,10 +2,14 @@ from asyncio import Protocol, get_event_loop, wait_for
 from asyncio.selector_events import _SelectorSocketTransport as AIOSST
 from asyncio.streams import StreamReader
 from socket import AF_INET, AF_INET6, gaierror, inet_ntop, inet_pton
+from time import monotonic
 from typing import Optional
 
+from python_socks import ProxyError
 from python_socks.async_.asyncio import Proxy
 
+from .upstreams import Upstream, UpstreamSelector
+
 
 class LocalTCP(Protocol):
     STAGE_NEGOTIATE = 0
@@ -34,6 +38,7 @@ class LocalTCP(Protocol):
     def connection_made(self, transport: AIOSST) -> None:
         self.transport = transport
         self.stream_reader.set_transport(transport)
+        self.config['CONNECTIONS'].add(self)
 
         loop = get_event_loop()
 
@@ -81,39 +86,79 @@ class LocalTCP(Protocol):
 
         return VER + REP + RSV + ATYP + BND_ADDR + BND_PORT
 
+    async def _connect_upstream(
+        self, upstream: Upstream, dst_addr: str, dst_port: int
+    ) -> tuple:
+        '''Connect to destanation via one upstream
+        :param upstream: Upstream - upstream proxy
+        :param dst_addr: str - destanation host
+        :param dst_port: int - destanation port'''
+
+        sock = await Proxy.from_url(upstream.url).connect(
+            dest_host=dst_addr, dest_port=dst_port
+        )
+
+        loop = get_event_loop()
+        return await loop.create_connection(
+            lambda: RemoteTCP(self, self.config), sock=sock
+        )
+
     async def connect(self, dst_addr: str, dst_port: int) -> None:
-        '''Create connection to destanation host&port via proxy
+        '''Create connection to destanation host&port via proxy.
+        Upstreams are tried in `UpstreamSelector` order, a dead or slow
+        upstream fails over to the next one.
         :param dst_addr: str - destanation host
         :param dst_port: int - destanation port'''
 
-        try:
-            sock = await Proxy.from_url(self.config['PROXY']).connect(
-                dest_host=dst_addr, dest_port=dst_port
-            )
+        selector: UpstreamSelector = self.config['UPSTREAMS']
+        rep = 1
 
-            loop = get_event_loop()
-            task = loop.create_connection(
-                lambda: RemoteTCP(self, self.config), sock=sock
-            )
-            remote_tcp_transport, remote_tcp = await wait_for(task, 5)
-        except ConnectionRefusedError:
-            self.transport.write(self.socks_reply(5))
-            raise ConnectionError
-        except gaierror:
-            self.transport.write(self.socks_reply(4))
-            raise ConnectionError
-        except Exception:
-            self.transport.write(self.socks_reply(1))
-            raise ConnectionError
-        else:
-            self.remote_tcp = remote_tcp
-            bind_addr, bind_port = remote_tcp_transport.get_extra_info(
-                "sockname"
-            )[:2]
-            self.transport.write(
-                self.socks_reply(0, bind_addr, bind_port)
-            )
-            self.stage = self.STAGE_CONNECT
+        for upstream in selector.candidates():
+            if self.transport.is_closing():
+                break
+
+            started = monotonic()
+
+            try:
+                remote_tcp_transport, remote_tcp = await wait_for(
+                    self._connect_upstream(upstream, dst_addr, dst_port),
+                    self.config.get('CONNECT_TIMEOUT', 5)
+                )
+            except ProxyError as e:
+                if e.error_code not in range(2, 9):
+                    # General failure or auth error: try next upstream
+                    selector.failure(upstream)
+                    rep = 1
+                    continue
+
+                # Upstream is alive, destanation is not reachable
+                selector.success(upstream, monotonic() - started)
+                rep = e.error_code
+                break
+            except gaierror:
+                selector.failure(upstream)
+                rep = 4
+            except ConnectionRefusedError:
+                selector.failure(upstream)
+                rep = 5
+            except Exception:
+                selector.failure(upstream)
+                rep = 1
+            else:
+                selector.success(upstream, monotonic() - started)
+
+                self.remote_tcp = remote_tcp
+                bind_addr, bind_port = remote_tcp_transport.get_extra_info(
+                    "sockname"
+                )[:2]
+                self.transport.write(
+                    self.socks_reply(0, bind_addr, bind_port)
+                )
+                self.stage = self.STAGE_CONNECT
+                return
+
+        self.transport.write(self.socks_reply(rep))
+        raise ConnectionError
 
     async def get_dst_addr(self, dst_addr_type: int) -> str:
         if dst_addr_type == 1:
@@ -189,6 +234,7 @@ class LocalTCP(Protocol):
 
         self.stage = self.STAGE_DESTROY
         self.is_closing = True
+        self.config['CONNECTIONS'].discard(self)
 
         self.negotiate_task and self.negotiate_task.cancel()
         self.transport and self.transport.close()
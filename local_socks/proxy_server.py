@@ -1,15 +1,24 @@
-from asyncio import all_tasks, current_task, gather
+from asyncio import gather
 
 from .protocols import LocalTCP
+from .upstreams import ProxySpec, UpstreamSelector, parse_upstreams
 
 
 class LocalSocks:
-    def __init__(self, loop, port: int, proxy: str):
-        assert proxy.startswith('socks5://'), 'Proxy must start from: socks5://'
+    def __init__(self, loop, port: int, proxy: ProxySpec, connect_timeout: float = 5):
+        upstreams = parse_upstreams(proxy)
+        assert all(
+            upstream.url.startswith('socks5://') for upstream in upstreams
+        ), 'Proxy must start from: socks5://'
+
+        self.upstreams = UpstreamSelector(upstreams)
         self.config = {
             "LISTEN_HOST": "127.0.0.1",
             "LISTEN_PORT": port,
-            "PROXY": proxy
+            "PROXY": upstreams[0].url,
+            "UPSTREAMS": self.upstreams,
+            "CONNECT_TIMEOUT": connect_timeout,
+            "CONNECTIONS": set()
         }
         self.loop = loop
         self.server = None
@@ -27,11 +36,18 @@ class LocalSocks:
             await self.server.wait_closed()
 
     async def shut_down(self) -> None:
-        await self.close_server()
+        '''Stop listening and close all relayed connections.
+        The loop is shared with the debugger and keeps running.'''
+
+        if self.server is not None:
+            self.server.close()
 
-        tasks = [t for t in all_tasks() if t is not current_task()]
-        [task.cancel() for task in tasks]
+        connections = list(self.config['CONNECTIONS'])
+        [connection.close() for connection in connections]
 
-        await gather(*tasks, return_exceptions=True)
+        await gather(*(
+            connection.negotiate_task for connection in connections
+            if connection.negotiate_task
+        ), return_exceptions=True)
 
-        self.loop.stop()
+        await self.close_server()
@@ -1,22 +1,31 @@
-from asyncio import to_thread, new_event_loop, run_coroutine_threadsafe
+from argparse import ArgumentParser
+from asyncio import gather, to_thread
 from functools import wraps
+from hmac import compare_digest
 from html import escape as html_escape
-from json import dumps
-from os import getcwd
+from os import environ, getcwd
 from re import findall as re_findall
 from secrets import token_urlsafe
+from typing import AsyncIterator, Dict, Optional, Tuple
 from uuid import uuid4
-from shutil import rmtree
-from threading import Thread
-from datetime import datetime
-from json import loads
 
 
 from aiofiles import open as aio_open
-from sanic import HTTPResponse, Request, Sanic, html, redirect
-
-from helpers.masking import MaskingTools
-from chromedebugg import ChromeDebugg
+from sanic import HTTPResponse, Request, Sanic, html, json, redirect
+
+from helpers.backend import Backend, BackendClient, serve as serve_backend
+from helpers.bulk import FORMATS, ProfileImport, iter_export
+from helpers.config import ConfigService
+from helpers.profiles import ProfileStore, new_profile
+from helpers.storage import ProfileTemplates
+from helpers.worker import TOKEN_HEADER
+from local_socks.upstreams import (
+    ProxySpec,
+    format_proxy_field,
+    parse_proxy_field,
+    proxy_error,
+    upstream_urls
+)
 
 
 app = Sanic("Marionett")
@@ -26,10 +35,22 @@ app.static(
 
 app.config['MM_PATH'] = getcwd()
 app.config['MM_TOKEN'] = token_urlsafe(32)
-app.config['MM_MASKING'] = MaskingTools()
+app.config['MM_CONFIG'] = ConfigService(
+    f'{app.config["MM_PATH"]}/chrome_settings.json'
+)
+app.config['MM_TEMPLATES'] = ProfileTemplates(
+    f'{app.config["MM_PATH"]}/profiles/.templates'
+)
+app.config['MM_PROFILES'] = ProfileStore(
+    f"{app.config['MM_PATH']}/profiles.json",
+    app.config['MM_CONFIG'].config.storage.get('profiles_debounce', 0.5)
+)
 
-with open('profiles.json', 'r', encoding='utf-8') as file:
-    app.config['MM_PROFILES'] = loads(file.read())
+# Set for web workers of `--workers N`: launcher, geo data and background
+# services live in one backend process, see `helpers.backend`
+app.config['MM_BACKEND_URL'] = environ.get('MM_BACKEND_URL', None)
+app.config['MM_BACKEND_TOKEN'] = environ.get('MM_BACKEND_TOKEN', None)
+app.config['MM_BACKEND'] = None
 
 
 def authorized(f):
@@ -71,17 +92,120 @@ async def read_template(name: str) -> str:
     return data
 
 
+@app.before_server_start
+async def start_services(app: Sanic) -> None:
+    if app.config['MM_BACKEND_URL']:
+        app.config['MM_BACKEND'] = BackendClient(
+            app.config['MM_BACKEND_URL'], app.config['MM_BACKEND_TOKEN']
+        )
+        await app.config['MM_BACKEND'].wait_ready()
+        return
+
+    app.config['MM_BACKEND'] = Backend(
+        app.config['MM_PATH'], app.config['MM_CONFIG'], app.config['MM_PROFILES']
+    )
+    app.config['MM_CONFIG'].start()
+    app.config['MM_BACKEND'].start()
+
+
+@app.after_server_stop
+async def stop_services(app: Sanic) -> None:
+    await app.config['MM_PROFILES'].close()
+
+    if app.config['MM_BACKEND_URL']:
+        await app.config['MM_BACKEND'].close()
+        return
+
+    await app.config['MM_BACKEND'].stop()
+    app.config['MM_CONFIG'].stop()
+
+
+def backend() -> Backend | BackendClient:
+    '''
+        Launcher and background services, in process or over RPC
+    '''
+
+    return app.config['MM_BACKEND']
+
+
+def upstream_state(result: Optional[dict]) -> Tuple[str, Optional[float]]:
+    '''
+        Status icon and latency of one upstream from the health-check cache
+
+        :param result: dict - `ProbeResult` as dict, `None` if not probed
+    '''
+
+    if not result:
+        return '⚪', None
+
+    if not result['alive']:
+        return f'<span title="{html_escape(result["error"] or "")}">🔴</span>', None
+
+    return '🟢', result['latency_ms']
+
+
+def proxy_state(proxy: ProxySpec, results: Dict[str, Optional[dict]]) -> str:
+    '''
+        Proxy status, like: "🟢 120 ms", one icon per upstream plus
+        the best latency for upstream lists: "🟢🔴 120 ms"
+
+        :param proxy: str | list - `profile['proxy']`
+        :param results: dict - `Backend.proxies()`
+    '''
+
+    urls = upstream_urls(proxy)
+
+    if urls == ['direct://']:
+        return 'direct'
+
+    states = [upstream_state(results.get(url, None)) for url in urls]
+    latencies = [latency for _, latency in states if latency is not None]
+    icons = ''.join(icon for icon, _ in states)
+
+    return f'{icons} {min(latencies):.0f} ms' if latencies else icons
+
+
+def valid_proxy(proxy: ProxySpec) -> bool:
+    '''
+        Proxy can be launched, same check as `ChromeDebugg` on launch
+
+        :param proxy: str | list - parsed proxy field
+    '''
+
+    try:
+        return proxy_error(upstream_urls(proxy)) is None
+    except AssertionError:
+        return False
+
+
+def disk_size(value: int) -> str:
+    '''
+        Human readable size, like: "12.5 MB"
+
+        :param value: int - bytes, `None` if not scanned yet
+    '''
+
+    if value is None:
+        return '-'
+
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if value < 1024:
+            break
+        value /= 1024
+
+    return f'{value:.1f} {unit}'
+
+
 async def update_profiles() -> None:
     '''
-        Save all changes in profiles to file
-        
-        Profiles data stored in `app.config['MM_PROFILES']`
+        Profile changes (`MM_PROFILES.put()` / `pop()`) are written
+        behind, once per `chrome_settings.json`['storage']['profiles_debounce'].
+        With several web workers the write is awaited, so the next
+        request sees the change whichever worker serves it.
     '''
 
-    async with aio_open(
-        f"{app.config['MM_PATH']}/profiles.json", 'w', encoding='utf-8'
-    ) as conf_file:
-        await conf_file.write(dumps(app.config['MM_PROFILES'], indent=4))
+    if app.config['MM_BACKEND_URL']:
+        await app.config['MM_PROFILES'].flush()
 
 
 @authorized
@@ -91,6 +215,7 @@ async def index(request: Request) -> HTTPResponse:
 
     table_data = ''
     template = await read_template('index')
+    usage, proxies = await gather(backend().usage(), backend().proxies())
 
     for puuid, data in app.config['MM_PROFILES'].items():
         table_data += '''
@@ -98,9 +223,13 @@ async def index(request: Request) -> HTTPResponse:
                         <td>{$NAME$}</td>
                         <td>{$DESC$}</td>
                         <td>{$DATE$}</td>
+                        <td>{$PROXY$}</td>
+                        <td>{$DISK$}</td>
                         <td>
                             <a href="/run/{$UUID$}" title="Run Profile">▶️</a> | 
+                            <a href="/stop/{$UUID$}" title="Stop Profile">⏹️</a> | 
                             <a href="/edit/{$UUID$}" title="Edit Profile">✍️</a> | 
+                            <a href="/snapshot/{$UUID$}" title="Save as Template">📸</a> | 
                             <a href="/delete/{$UUID$}" title="Delete Profile">🗑️</a>
                         </td>
                     </tr>
@@ -108,7 +237,11 @@ async def index(request: Request) -> HTTPResponse:
 '''.replace('{$NAME$}', data['name']) \
                .replace('{$DESC$}', data['desc']) \
                .replace('{$UUID$}', puuid) \
-               .replace('{$DATE$}', data['created'])
+               .replace('{$DATE$}', data['created']) \
+               .replace('{$PROXY$}', proxy_state(data['proxy'], proxies)) \
+               .replace('{$DISK$}', disk_size(
+                   usage.get(puuid, {}).get('bytes', None)
+               ))
 
     template = template.replace('{$TABLE_DATA$}', table_data)
 
@@ -127,6 +260,12 @@ async def create(request: Request) -> HTTPResponse:
             template = template.replace(item, '25.2048')
         elif item == '{{PROFILE_lon}}':
             template = template.replace(item, '55.2708')
+        elif item == '{{PROFILE_template}}':
+            template = template.replace(item, ''.join(
+                f'<option value="{html_escape(tpl["name"])}">'
+                f'{html_escape(tpl["name"])}</option>'
+                for tpl in await to_thread(app.config['MM_TEMPLATES'].list)
+            ))
         else:
             template = template.replace(item, '')
 
@@ -145,31 +284,95 @@ async def create_save(request: Request) -> HTTPResponse:
     if not request.form.get('lon', None):
         return redirect('/create')
 
-    uuid = str(uuid4())
+    proxy = parse_proxy_field(request.form.get('proxy', 'direct://'))
 
-    app.config['MM_PROFILES'][uuid] = {
-        'name': request.form.get('name', ''),
-        'created': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        'path': f'{app.config["MM_PATH"]}/profiles/{uuid}',
-        'proxy': request.form.get('proxy', 'direct://'),
-        'desc': html_escape(request.form.get('desc', '')),
-        'spoofing': {
-            'geo': {
-                'lat': float(request.form['lat'][0]),
-                'lon': float(request.form['lon'][0])
-            },
-            'hardware': {
-                'cpu': int(request.form.get('cpu', 0)),
-                'ram': int(request.form.get('ram', 0))
-            }
-        }
-    }
+    if not valid_proxy(proxy):
+        return redirect('/create')
+
+    uuid = str(uuid4())
+    path = f'{app.config["MM_PATH"]}/profiles/{uuid}'
+
+    if template := request.form.get('template', ''):
+        try:
+            await to_thread(app.config['MM_TEMPLATES'].clone, template, path)
+        except AssertionError:
+            return redirect('/create')
+
+    app.config['MM_PROFILES'].put(uuid, new_profile(
+        app.config['MM_PATH'], uuid, request.form.get('name', ''), proxy,
+        float(request.form['lat'][0]), float(request.form['lon'][0]),
+        int(request.form.get('cpu', 0)), int(request.form.get('ram', 0)),
+        request.form.get('desc', ''), request.form.get('launch_args', '').split(),
+        template
+    ))
 
     await update_profiles()
 
     return redirect('/')
 
 
+async def body_chunks(request: Request) -> AsyncIterator[bytes]:
+    while (chunk := await request.stream.read()) is not None:
+        yield chunk
+
+
+@authorized
+@app.post("/import", stream=True)
+async def import_profiles(request: Request) -> HTTPResponse:
+    '''
+        Bulk import. Body: streamed NDJSON, or CSV with `?format=csv` /
+        `Content-Type: text/csv`, one profile per line: name, proxy,
+        lat, lon, cpu, ram, desc, launch_args.
+        Nothing is imported if a row is invalid, unless `?skip_invalid=1`.
+        CLI: python -m helpers.bulk import profiles.csv
+
+        Return JSON report, like: {"rows": 10, "imported": 10, "failed": 0, "errors": []}
+    '''
+
+    format = request.args.get('format', None) or (
+        'csv' if 'csv' in request.headers.get('content-type', '') else 'ndjson'
+    )
+
+    if format not in FORMATS:
+        return json({'error': f'unknown format: {format}'}, status=400)
+
+    importer = ProfileImport(app.config['MM_PATH'], format)
+    report = await importer.run(body_chunks(request), backend().country_specs)
+
+    if importer.failed and not request.args.get('skip_invalid', None):
+        return json(report | {'imported': 0}, status=400)
+
+    # One transaction: all profiles at once, one `profiles.json` write
+    app.config['MM_PROFILES'].put_many(importer.profiles)
+    await update_profiles()
+
+    return json(report)
+
+
+@authorized
+@app.get("/export")
+async def export_profiles(request: Request) -> HTTPResponse:
+    '''
+        Stream all profiles as NDJSON, or CSV with `?format=csv`.
+        Output can be imported again by `/import`.
+    '''
+
+    format = request.args.get('format', 'ndjson')
+
+    if format not in FORMATS:
+        return json({'error': f'unknown format: {format}'}, status=400)
+
+    response = await request.respond(
+        content_type=FORMATS[format],
+        headers={'Content-Disposition': f'attachment; filename="profiles.{format}"'}
+    )
+
+    for chunk in iter_export(list(app.config['MM_PROFILES'].items()), format):
+        await response.send(chunk)
+
+    await response.eof()
+
+
 @authorized
 @app.get("/delete/<uuid:uuid>")
 async def delete(request: Request, uuid: str) -> HTTPResponse:
@@ -184,19 +387,61 @@ async def delete(request: Request, uuid: str) -> HTTPResponse:
     if not app.config['MM_PROFILES'].get(uuid, None):
         return redirect('/')
 
+    # Rename only, files are deleted by the background reaper. The
+    # backend looks the path up, so the profile is removed after
+    await backend().trash(uuid)
+
     app.config['MM_PROFILES'].pop(uuid)
     await update_profiles()
 
-    try:
-        await to_thread(
-            rmtree, f'profiles/{uuid}'
-        )
-    except FileNotFoundError:
-        pass
-
     return redirect('/')
 
 
+@authorized
+@app.get("/proxies")
+async def proxies(request: Request) -> HTTPResponse:
+    '''
+        Proxy health per profile. `?check=1` probes right away.
+    '''
+
+    results = await backend().proxies(bool(request.args.get('check', None)))
+
+    return json({
+        uuid: {url: results.get(url, None) for url in upstream_urls(profile['proxy'])}
+        for uuid, profile in app.config['MM_PROFILES'].items()
+    })
+
+
+@authorized
+@app.get("/targets")
+async def targets(request: Request) -> HTTPResponse:
+    '''
+        Target states, counters and per-type attached/filtered counts
+        of running profiles, per worker if any
+    '''
+
+    return json(await backend().targets())
+
+
+@authorized
+@app.get("/metrics/attach")
+async def attach_metrics(request: Request) -> HTTPResponse:
+    '''
+        Attach latency histograms per target type, per worker if any.
+        CLI: python -m helpers.metrics
+    '''
+
+    return json(await backend().metrics())
+
+
+@authorized
+@app.get("/usage")
+async def usage(request: Request) -> HTTPResponse:
+    ''' Disk usage per profile, from the last scan '''
+
+    return json(await backend().usage())
+
+
 @authorized
 @app.get("/run/<uuid:uuid>")
 async def run(request: Request, uuid: str) -> HTTPResponse:
@@ -208,24 +453,109 @@ async def run(request: Request, uuid: str) -> HTTPResponse:
 
     uuid = str(uuid)
 
-    def _background_loop(profile_name: str):
-            loop = new_event_loop()
-            Thread(target=loop.run_forever, name=profile_name).start()
-            return loop
-
     if not app.config['MM_PROFILES'].get(uuid, None):
         return redirect('/')
 
-    run_coroutine_threadsafe(
-        ChromeDebugg(
-            app.config['MM_PROFILES'][uuid], app.config['MM_MASKING']
-        ).main(),
-        _background_loop(f'ChromeProfile_{uuid}')
-    )
+    app.add_task(backend().launch(uuid, app.config['MM_PROFILES'].get(uuid)))
 
     return redirect('/')
 
 
+@authorized
+@app.get("/stop/<uuid:uuid>")
+async def stop(request: Request, uuid: str) -> HTTPResponse:
+    '''
+        Close browser of running Profile by given UUID
+
+        :param uuid: str - profile UUID
+    '''
+
+    await backend().stop_profile(str(uuid))
+
+    return redirect('/')
+
+
+@authorized
+@app.post("/run")
+async def run_batch(request: Request) -> HTTPResponse:
+    '''
+        Run many Profiles at once with admission control.
+        Body: JSON, like: {"uuids": ["...", "..."]}
+
+        Return JSON with launch timings per profile
+    '''
+
+    uuids = (request.json or {}).get('uuids', [])
+    unknown = [uuid for uuid in uuids if uuid not in app.config['MM_PROFILES']]
+
+    if unknown or not uuids:
+        return json({'error': 'unknown profiles', 'uuids': unknown}, status=400)
+
+    return json(await backend().launch_batch({
+        uuid: app.config['MM_PROFILES'].get(uuid) for uuid in uuids
+    }))
+
+
+@authorized
+@app.post("/workers")
+async def workers_register(request: Request) -> HTTPResponse:
+    '''
+        Register worker node. Body: JSON, like: {"url": "http://host:9001"}.
+        Workers get the profiles with their proxies, so the caller must send
+        `chrome_settings.json`['worker_token'] in `TOKEN_HEADER`
+    '''
+
+    token = app.config['MM_CONFIG'].config.worker_token
+
+    if not token or not compare_digest(
+        request.headers.get(TOKEN_HEADER, '').encode(), token.encode()
+    ):
+        return json({'error': 'worker_token required'}, status=403)
+
+    if not (url := (request.json or {}).get('url', None)):
+        return json({'error': 'url is required'}, status=400)
+
+    return json({'workers': await backend().register_worker(url)})
+
+
+@authorized
+@app.get("/workers")
+async def workers_status(request: Request) -> HTTPResponse:
+    ''' Status of registered worker nodes '''
+
+    return json(await backend().workers_status())
+
+
+@authorized
+@app.get("/snapshot/<uuid:uuid>")
+async def snapshot(request: Request, uuid: str) -> HTTPResponse:
+    '''
+        Save profile user-data-dir as template for new profiles.
+        Profile must not be running.
+
+        :param uuid: str - profile UUID
+        :param name: str - query arg, template name (default: UUID)
+    '''
+
+    uuid = str(uuid)
+
+    if not app.config['MM_PROFILES'].get(uuid, None):
+        return json({'error': 'unknown profile'}, status=404)
+    if uuid in await backend().running():
+        return json({'error': 'profile is running'}, status=409)
+
+    try:
+        stats = await to_thread(
+            app.config['MM_TEMPLATES'].snapshot,
+            app.config['MM_PROFILES'].get(uuid)['path'],
+            request.args.get('name', uuid)
+        )
+    except AssertionError as e:
+        return json({'error': str(e)}, status=400)
+
+    return json(stats)
+
+
 @authorized
 @app.get("/edit/<uuid:uuid>")
 async def edit(request: Request, uuid: str) -> HTTPResponse:
@@ -240,7 +570,7 @@ async def edit(request: Request, uuid: str) -> HTTPResponse:
     if not app.config['MM_PROFILES'].get(uuid, None):
         return redirect('/')
 
-    profile = app.config['MM_PROFILES'][uuid]
+    profile = app.config['MM_PROFILES'].get(uuid)
     template = await read_template('new')
 
     for item in re_findall('{{PROFILE_.*}}', template):
@@ -248,7 +578,9 @@ async def edit(request: Request, uuid: str) -> HTTPResponse:
             case "{{PROFILE_name}}":
                 template = template.replace(item, profile['name'])
             case "{{PROFILE_proxy}}":
-                template = template.replace(item, profile['proxy'])
+                template = template.replace(
+                    item, html_escape(format_proxy_field(profile['proxy']))
+                )
             case "{{PROFILE_desc}}":
                 template = template.replace(item, profile['desc'])
             case "{{PROFILE_lat}}":
@@ -267,6 +599,12 @@ async def edit(request: Request, uuid: str) -> HTTPResponse:
                 template = template.replace(
                     item, str(profile['spoofing']['hardware']['ram'])
                 )
+            case "{{PROFILE_template}}":
+                template = template.replace(item, '')
+            case "{{PROFILE_launch_args}}":
+                template = template.replace(
+                    item, html_escape('\n'.join(profile.get('launch_args', [])))
+                )
 
     template = template.replace(
         'action="/create"', f'action="/edit/{uuid}"'
@@ -282,10 +620,16 @@ async def edit_handle(request: Request, uuid: str) -> HTTPResponse:
     if not app.config['MM_PROFILES'].get(uuid, None):
         return redirect('/')
 
-    app.config['MM_PROFILES'][uuid].update({
+    proxy = parse_proxy_field(request.form.get('proxy', 'direct://'))
+
+    if not valid_proxy(proxy):
+        return redirect(f'/edit/{uuid}')
+
+    app.config['MM_PROFILES'].put(uuid, app.config['MM_PROFILES'].get(uuid) | {
         'name': request.form.get('name', ''),
-        'proxy': request.form.get('proxy', 'direct://'),
+        'proxy': proxy,
         'desc': html_escape(request.form.get('desc', '')),
+        'launch_args': request.form.get('launch_args', '').split(),
         'spoofing': {
             'geo': {
                 'lat': float(request.form['lat'][0]),
@@ -303,4 +647,26 @@ async def edit_handle(request: Request, uuid: str) -> HTTPResponse:
     return redirect('/')
 
 if __name__ == '__main__':
-    app.run('127.0.0.1', 8080)
+    parser = ArgumentParser(description='Marionette web interface')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=1, help='web worker processes')
+    parser.add_argument(
+        '--backend-port', type=int, default=9000,
+        help='RPC port of the backend process, used with --workers > 1'
+    )
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        # Inherited by the web workers, read on import
+        environ['MM_BACKEND_URL'] = f'http://127.0.0.1:{args.backend_port}'
+        environ['MM_BACKEND_TOKEN'] = token_urlsafe(32)
+
+        @app.main_process_ready
+        async def start_backend(app: Sanic) -> None:
+            app.manager.manage('Backend', serve_backend, {
+                'root': app.config['MM_PATH'], 'token': environ['MM_BACKEND_TOKEN'],
+                'port': args.backend_port
+            })
+
+    app.run(args.host, args.port, workers=args.workers)